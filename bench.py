@@ -0,0 +1,338 @@
+"""Benchmarks for Stint Tracker
+
+Writes a deterministic synthetic history (logs, settings and treat bank) for each size,
+then times the hot functions and each command end to end against it without prompting:
+
+python bench.py --sizes 1k 100k --save before.json
+python bench.py --sizes 1k 100k --compare before.json
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+from unittest import mock
+
+import main
+
+# name -> (number of stints, years of history)
+SIZES = {
+    "1k": (1_000, 1),
+    "10k": (10_000, 3),
+    "100k": (100_000, 10),
+    "1m": (1_000_000, 20),
+}
+
+INTERVALS = [
+    {"unit": "day", "amount": 1},
+    {"unit": "day", "amount": 7},
+    {"unit": "week", "amount": 1},
+    {"unit": "week", "amount": 4},
+]
+
+PROJECTS = [f"Project {i}" for i in range(8)]
+
+
+def generate_logs(num_stints: int, years: float, seed=0) -> list[dict]:
+    """Deterministic synthetic stints spread evenly over the last `years` years"""
+    rng = random.Random(seed)
+    end = int(time.time()) - main.hour
+    start = end - int(years * main.year)
+    return [
+        {
+            "task": rng.choice(PROJECTS),
+            "start": s,
+            "duration": rng.randint(10 * 60, 3 * main.hour),
+            "notes": rng.choice([None, None, None, "Some notes for next time"]),
+            "treat_picked": rng.choice([None, None, "Walk"]),
+        }
+        for s in sorted(rng.randint(start, end) for _ in range(num_stints))
+    ]
+
+
+def generate_settings(num_stints: int) -> dict:
+    """Settings with treats at thresholds from easily reached to out of reach"""
+
+    def treats(name: str, hours: list[float]):
+        return [
+            {
+                "hours": h,
+                "treat": {
+                    "description": f"{name} treat at {h} hours",
+                    "grace_period": "1:00:00:00:00",
+                },
+            }
+            for h in hours
+        ]
+
+    return {
+        "min_stint_time": "10:00",
+        "end_stint_at": "23:00:00",
+        "storage": "jsonl",
+        "projects": PROJECTS,
+        "treats_after_stint": {"max_duration": "15:00", "treats": ["Walk", "Juggle"]},
+        "total_time_treats": treats("Total time", [10, 100, 1000, num_stints * 2]),
+        "high_score_intervals": [
+            {
+                **interval,
+                "treats": treats(
+                    f"{interval['amount']} {interval['unit']}",
+                    [interval["amount"] * n for n in (1, 4, 40, 400)],
+                ),
+            }
+            for interval in INTERVALS
+        ],
+    }
+
+
+def generate_treat_bank(num_treats=50, seed=0) -> list[dict]:
+    """Banked treats - a few already expired, some that never expire"""
+    rng = random.Random(seed)
+    now = time.time()
+    return [
+        {
+            "id": i + 1,
+            "description": f"Banked treat {i + 1}",
+            "expires_at": rng.choice([None, now + rng.randint(-main.day, main.week)]),
+        }
+        for i in range(num_treats)
+    ]
+
+
+def write_fixtures(
+    directory: str, num_stints: int, years: float, storage="jsonl", seed=0
+):
+    """Writes the fixtures to `directory`/data with a copy of main.py to run them with"""
+    data_dir = os.path.join(directory, "data")
+    os.makedirs(data_dir, exist_ok=True)
+    shutil.copy(main.__file__, os.path.join(directory, "main.py"))
+
+    with open(os.path.join(data_dir, "logs.jsonl"), "w") as file:
+        for log in generate_logs(num_stints, years, seed):
+            file.write(json.dumps(log) + "\n")
+    settings = generate_settings(num_stints)
+    settings["storage"] = storage
+    with open(os.path.join(data_dir, "settings.json"), "w") as file:
+        json.dump(settings, file, indent=2)
+    with open(os.path.join(data_dir, "treat_bank.json"), "w") as file:
+        json.dump(generate_treat_bank(seed=seed), file, indent=2)
+
+
+class Fixture:
+    """A copy of the app loaded against the fixtures in `directory`"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.data_dir = os.path.join(directory, "data")
+        self.originals = {}
+        for name in ("settings.json", "treat_bank.json"):
+            with open(os.path.join(self.data_dir, name), "r") as file:
+                self.originals[name] = file.read()
+
+        spec = importlib.util.spec_from_file_location(
+            f"bench_app_{id(self)}", os.path.join(directory, "main.py")
+        )
+        self.app = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(self.app)
+
+    def reset(self):
+        """Restores the settings and treat bank and drops every in-memory cache"""
+        for name, contents in self.originals.items():
+            with open(os.path.join(self.data_dir, name), "w") as file:
+                file.write(contents)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.app.TREAT_STATE_PATH)
+        self.app._file_cache.clear()
+        self.app._derived_cache.clear()
+        if "sqlite" in self.app._log_stores:
+            self.app.get_log_store().save_treats(
+                json.loads(self.originals["treat_bank.json"])
+            )
+
+
+@contextlib.contextmanager
+def scripted(answers=(), choice=None):
+    """Answers input() with `answers` then ^C, picks `choice` in questionary prompts and
+    discards everything printed"""
+    replies = iter(answers)
+
+    def reply(prompt=""):
+        answer = next(replies, None)
+        if answer is None:
+            raise KeyboardInterrupt
+        return answer
+
+    prompt = mock.Mock(**{"ask.return_value": choice})
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        with mock.patch("builtins.input", reply), mock.patch(
+            "questionary.select", return_value=prompt
+        ):
+            yield
+
+
+def time_call(func, repeat=3, setup=None):
+    """Best wall time of `repeat` calls, in seconds - `setup` runs untimed before each"""
+    best = float("inf")
+    for _ in range(repeat):
+        setup and setup()
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_functions(fixture: Fixture, repeat=3):
+    app = fixture.app
+    fixture.reset()
+    timeline = app.get_timeline()
+    index = app.DayIndex(timeline)
+    previous = app.LogTimeline(
+        stint.to_dict() for stint in timeline.stints(0, len(timeline) - 1)
+    )
+    last_stint = timeline[len(timeline) - 1].to_dict()
+
+    def analytics(use_numpy: bool):
+        context = app.AnalyticsContext(timeline)
+        context.use_numpy = use_numpy
+        context.week_averages
+        context.high_scores(INTERVALS)
+
+    def evaluate_previous():
+        fixture.reset()
+        with scripted():
+            app.update_treats(previous)
+
+    def update_treats(**kwargs):
+        with scripted():
+            app.update_treats(timeline, **kwargs)
+
+    results = {
+        "get_timeline": time_call(app.get_timeline, repeat, fixture.reset),
+        "DayIndex": time_call(lambda: app.DayIndex(timeline), repeat),
+        "get_weeks_data": time_call(lambda: app.get_weeks_data(index), repeat),
+        "get_high_score": time_call(
+            lambda: app.get_high_score(app.AnalyticsContext(timeline), "week", 4),
+            repeat,
+        ),
+        "analytics (python)": time_call(lambda: analytics(False), repeat),
+    }
+    if app._numpy():
+        results["analytics (numpy)"] = time_call(lambda: analytics(True), repeat)
+    results["update_treats (full)"] = time_call(update_treats, repeat, fixture.reset)
+    results["update_treats (one stint)"] = time_call(
+        lambda: update_treats(stint=last_stint), repeat, evaluate_previous
+    )
+    return results
+
+
+def bench_commands(fixture: Fixture, repeat=3):
+    """Each command end to end from cold caches, as a fresh launch would run it"""
+    app = fixture.app
+    fixture.reset()
+    first_day = time.strftime("%Y-%m-%d", time.localtime(app.get_timeline().starts[0]))
+    today = time.strftime("%Y-%m-%d")
+
+    def command(func, answers=(), choice=None):
+        def run():
+            with scripted(answers, choice):
+                func()
+
+        return run
+
+    commands = {
+        "l": command(app.show_summary),
+        "lw": command(app.show_week, [f"{first_day}:{today}"]),
+        "lt": command(app.show_treats),
+        "ll": command(app.show_logs, ["n", "n", "p"], choice="All tasks"),
+        "t": command(app.show_treat_bank),
+    }
+    for name in app.queries:
+        commands[f"query {name}"] = command(lambda name=name: app.run_query(name))
+    return {
+        name: time_call(func, repeat, fixture.reset) for name, func in commands.items()
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except FileNotFoundError:
+        return None
+
+
+def print_results(results: dict, baseline: dict | None = None):
+    for size, timings in results.items():
+        num_stints, years = SIZES[size]
+        print(f"\n{num_stints} stints over {years} years\n")
+        if baseline:
+            print(f"  {'':<28}{'now':>14}{'baseline':>14}{'speedup':>9}")
+        for name, seconds in timings.items():
+            line = f"  {name:<28}{seconds * 1000:>11.1f} ms"
+            old = (baseline or {}).get(size, {}).get(name)
+            if old:
+                line += f"{old * 1000:>11.1f} ms{old / seconds:>8.2f}x"
+            print(line)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", choices=SIZES, default=["1k", "10k"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--storage", choices=["jsonl", "sqlite"], default="jsonl")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--fixtures", help="Directory to keep the generated fixtures in"
+    )
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    parser.add_argument(
+        "--compare", help="Results saved by an earlier run to show speedups against"
+    )
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in args.sizes:
+            directory = os.path.join(args.fixtures or tmp_dir, size)
+            write_fixtures(directory, *SIZES[size], args.storage, args.seed)
+            fixture = Fixture(directory)
+            results[size] = {
+                **bench_functions(fixture, args.repeat),
+                **bench_commands(fixture, args.repeat),
+            }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as file:
+            baseline = json.load(file)["results"]
+    print_results(results, baseline)
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(
+                {
+                    "commit": git_commit(),
+                    "python": platform.python_version(),
+                    "numpy": bool(main._numpy()),
+                    "storage": args.storage,
+                    "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "results": results,
+                },
+                file,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -1,23 +1,25 @@
-import argparse
 import time
-import asyncio
-from playsound import playsound
+
+_started_at = time.perf_counter()
+
+import argparse
 import json
-import questionary
 import sys
 import os
-from rich.console import Console
-from rich.table import box
-from rich.table import Table
 from typing import Literal
-import shutil
-from threading import Thread
+from datetime import date, datetime, timezone
+from bisect import bisect_left, bisect_right, insort
+from array import array
+from functools import cached_property, wraps
+from contextlib import contextmanager
+
+# asyncio, playsound, questionary, rich and sqlite3 are imported by the functions that
+# use them, so launching for a quick command doesn't pay for them
 
 
 """
 TO DO
 - Make treats specific to project
-- Create a choose project function which is called at the start of every command to filter the logs and settings to that project
 - Add deadlines where you must accomplish something by a given deadline
 - Add an option for show week to just give the last {num} weeks
 """
@@ -29,8 +31,14 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 os.makedirs(os.path.join(SCRIPT_DIR, "data"), exist_ok=True)
 
 SETTINGS_PATH = os.path.join(SCRIPT_DIR, "data/settings.json")
-LOGS_PATH = os.path.join(SCRIPT_DIR, "data/logs.json")
+LOGS_PATH = os.path.join(SCRIPT_DIR, "data/logs.jsonl")
+LEGACY_LOGS_PATH = os.path.join(SCRIPT_DIR, "data/logs.json")
 TREAT_BANK_PATH = os.path.join(SCRIPT_DIR, "data/treat_bank.json")
+DB_PATH = os.path.join(SCRIPT_DIR, "data/stints.db")
+TREAT_STATE_PATH = os.path.join(SCRIPT_DIR, "data/treat_state.json")
+AGGREGATES_PATH = os.path.join(SCRIPT_DIR, "data/aggregates.json")
+DATA_LOCK_PATH = os.path.join(SCRIPT_DIR, "data/.lock")
+JOURNAL_DIR = os.path.join(SCRIPT_DIR, "data/journal")
 SUCCESS_PATH = os.path.join(SCRIPT_DIR, "sounds/success.mp3")
 FIVE_MINS_LEFT_PATH = os.path.join(SCRIPT_DIR, "sounds/five_minutes_left.mp3")
 STINT_ENDED_PATH = os.path.join(SCRIPT_DIR, "sounds/stint_ended.mp3")
@@ -93,12 +101,101 @@ def seconds_to_time(seconds: int):
     return ":".join(units).lstrip("0") if len(units) > 1 or int(units[0]) else "0"
 
 
-def clear_print(text: str, lines_to_clear: int = 1):
-    if lines_to_clear > 1:
-        for _ in range(lines_to_clear - 1):
-            print("\033[A\033[K", end="", flush=True)
-    print(f"\033[K\r{' ' * 60}", end="", flush=True)
-    print(f"\033[K\r{text}", end="", flush=True)
+class TimerDisplay:
+    """Redraws a block of text in place, writing only the characters that changed
+
+    Each frame is sent as a single write. When stdout isn't a terminal nothing is redrawn,
+    only the final text is written.
+    """
+
+    def __init__(self, out=None):
+        self.out = sys.stdout if out is None else out
+        self.live = self.out.isatty()
+        self.lines: list[str] = []
+
+    def visible(self):
+        """Whether frames can be seen - a terminal with this process in the foreground"""
+        if not self.live:
+            return False
+        try:
+            return os.tcgetpgrp(self.out.fileno()) == os.getpgrp()
+        except (AttributeError, OSError):
+            return True
+
+    def draw(self, text: str):
+        lines = text.split("\n")
+        if len(lines) != len(self.lines):
+            # Back to the start of the block, clear it and write the frame in full
+            up = len(self.lines) - 1
+            buffer = (f"\033[{up}A" if up > 0 else "") + "\r\033[J" + text
+        else:
+            buffer, row = "", len(lines) - 1
+            for i, (old, new) in enumerate(zip(self.lines, lines)):
+                if old == new:
+                    continue
+                same = len(os.path.commonprefix([old, new]))
+                buffer += f"\033[{row - i}A" if i < row else ""
+                buffer += f"\033[{i - row}B" if i > row else ""
+                buffer += "\r" + (f"\033[{same}C" if same else "") + new[same:]
+                buffer += "\033[K" if len(new) < len(old) else ""
+                row = i
+            if not buffer:
+                return
+            if row < len(lines) - 1:
+                # Leave the cursor at the end of the last line, where input is typed
+                buffer += f"\033[{len(lines) - 1 - row}B\r"
+                buffer += f"\033[{len(lines[-1])}C" if lines[-1] else ""
+        self.lines = lines
+        self.out.write(buffer)
+        self.out.flush()
+
+    def finish(self, text: str):
+        """Replaces the frame with `text` and moves to a new line"""
+        if self.live:
+            self.draw(text)
+            self.out.write("\n")
+        else:
+            self.out.write(text + "\n")
+        self.lines = []
+        self.out.flush()
+
+
+async def run_timer(
+    frame,
+    display: TimerDisplay,
+    start: float | None = None,
+    deadline: float | None = None,
+    cues=(),
+):
+    """Draws `frame(elapsed_seconds)` on every whole second since `start` (monotonic time)
+
+    Ticks are scheduled against `start` rather than a second after the last one, so they
+    never drift. Returns once `deadline` seconds have elapsed. `cues` are (seconds,
+    callback) pairs, each called once that much time has passed. When the display can't
+    be seen the loop only wakes for cues and the deadline, checking back on a hidden
+    terminal every so often.
+    """
+    import asyncio
+
+    start = time.monotonic() if start is None else start
+    cues = sorted(cues, key=lambda cue: cue[0])
+    while True:
+        elapsed = time.monotonic() - start
+        while cues and cues[0][0] <= elapsed:
+            cues.pop(0)[1]()
+        if deadline is not None and elapsed >= deadline:
+            return
+
+        if display.visible():
+            display.draw(frame(round(elapsed)))
+            wake_at = int(elapsed) + 1
+        else:
+            wake_at = elapsed + (15 if display.live else hour)
+        if cues:
+            wake_at = min(wake_at, cues[0][0])
+        if deadline is not None:
+            wake_at = min(wake_at, deadline)
+        await asyncio.sleep(wake_at - elapsed)
 
 
 async def sleep_verbose(
@@ -108,20 +205,20 @@ async def sleep_verbose(
     cancel_message="Timer canceled",
     return_on_cancel=False,
 ):
+    import asyncio
+
     print()
+    display = TimerDisplay()
     try:
-        end_time = time.time() + seconds
-        while True:
-            remaining = end_time - time.time()
-            if round(remaining) <= 0:
-                break
-            clear_print(f"{time_message}: {seconds_to_time(round(remaining))}")
-            try:
-                await asyncio.sleep(1 + remaining - round(remaining))
-            except asyncio.CancelledError:
-                raise KeyboardInterrupt()
-        clear_print(end)
-        print()
+        try:
+            await run_timer(
+                lambda elapsed: f"{time_message}: {seconds_to_time(seconds - elapsed)}",
+                display,
+                deadline=seconds,
+            )
+        except asyncio.CancelledError:
+            raise KeyboardInterrupt()
+        display.finish(end)
     except KeyboardInterrupt:
         print()
         cancel_message and print(cancel_message)
@@ -135,60 +232,994 @@ async def stop_watch(
     elapsed_message="Elapsed time",
     stop_message="cancel",
     end_message: str | None = None,
-    start_time=time.time(),
+    start_time: float | None = None,
     time_limit: int | None = None,
     say_time_limit=True,
     time_up_sound_path=STINT_ENDED_PATH,
 ):
-    print("\n")
-    five_mins_past = time_limit and time_limit < 260
-    try:
-        while True:
-            elapsed_time = time.time() - start_time
+    import asyncio
 
-            clear_print(
-                f"{elapsed_message}: {seconds_to_time(round(elapsed_time))}\nPress ^C to {stop_message}: ",
-                lines_to_clear=2,
-            )
-            if time_limit:
-                if elapsed_time >= time_limit - 2:
-                    await asyncio.to_thread(playsound, time_up_sound_path)
-                    raise KeyboardInterrupt()
-                if say_time_limit:
-                    time_left = time_limit - elapsed_time
-                    if not five_mins_past and time_left <= 300:
-                        to_thread(playsound, FIVE_MINS_LEFT_PATH)
-                        five_mins_past = True
+    start_time = time.time() if start_time is None else start_time
+    print()
 
-            try:
-                await asyncio.sleep(max(0.1, 1 - (elapsed_time - round(elapsed_time))))
-            except asyncio.CancelledError:
-                raise KeyboardInterrupt()
+    cues = []
+    if time_limit and say_time_limit and time_limit >= 260:
+        cues.append((time_limit - 300, lambda: play_sound(FIVE_MINS_LEFT_PATH)))
+    try:
+        try:
+            await run_timer(
+                lambda elapsed: f"{elapsed_message}: {seconds_to_time(elapsed)}\nPress ^C to {stop_message}: ",
+                TimerDisplay(),
+                start=time.monotonic() - (time.time() - start_time),
+                deadline=time_limit and time_limit - 2,
+                cues=cues,
+            )
+        except asyncio.CancelledError:
+            raise KeyboardInterrupt()
+        if time_limit:
+            play_sound(time_up_sound_path)
     except KeyboardInterrupt:
-        print()
-        clear_print(
-            f"{end_message + ' - ' if end_message else ''}Final time: {seconds_to_time(round(time.time() - start_time))}\n"
-        )
+        pass
+    print()
+    print(
+        f"{end_message + ' - ' if end_message else ''}Final time: {seconds_to_time(round(time.time() - start_time))}"
+    )
     return round(time.time() - start_time)
 
 
+# Data access
+
+# path -> ((mtime_ns, size), parsed object)
+_file_cache: dict[str, tuple[tuple[int, int], object]] = {}
+
+
+def _file_key(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def load_cached(path, load):
+    """Returns `load()` for a file, only calling it again once the file's mtime or size changes
+
+    The returned object is shared between callers, so anything that mutates it must save it
+    back with `save_json`. Returns None if the file doesn't exist.
+    """
+    key = _file_key(path)
+    if key is None:
+        _file_cache.pop(path, None)
+        return None
+
+    cached = _file_cache.get(path)
+    if cached and cached[0] == key:
+        return cached[1]
+
+    value = load()
+    if _file_key(path) == key:
+        _file_cache[path] = (key, value)
+    return value
+
+
+# Held lock file and how many nested data_lock blocks are using it
+_data_lock: list = [None, 0]
+
+
+def _try_lock(file) -> bool:
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+
+        try:
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        return True
+    try:
+        fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def _unlock(file):
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+        return
+    fcntl.flock(file, fcntl.LOCK_UN)
+
+
+@contextmanager
+def data_lock():
+    """Holds the advisory lock on the data directory for a read-modify-write of its files
+
+    Other instances are waited on with short, growing sleeps rather than failing. The lock
+    is re-entrant, so functions that take it can call each other.
+    """
+    if _data_lock[1]:
+        _data_lock[1] += 1
+        try:
+            yield
+        finally:
+            _data_lock[1] -= 1
+        return
+
+    file = open(DATA_LOCK_PATH, "a+")
+    file.seek(0)
+    delay = 0.005
+    while not _try_lock(file):
+        time.sleep(delay)
+        delay = min(delay * 2, 0.1)
+    _data_lock[:] = [file, 1]
+    try:
+        yield
+    finally:
+        _data_lock[:] = [None, 0]
+        _unlock(file)
+        file.close()
+
+
+def write_atomic(path, write, fsync=False):
+    """Calls `write(file)` on a temporary file then moves it over `path` in one step,
+    so readers see either the old or the new contents"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with data_lock():
+        with open(tmp_path, "w") as file:
+            write(file)
+            if fsync:
+                file.flush()
+                os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+
+
 def save_json(obj, path=SETTINGS_PATH):
-    with open(path, "w") as file:
-        json.dump(obj, file, indent=2)
+    write_atomic(path, lambda file: json.dump(obj, file, indent=2))
+    _file_cache[path] = (_file_key(path), obj)
 
 
 def get_json(path=SETTINGS_PATH, default={}):
-    try:
+    def load():
         with open(path, "r") as file:
             return json.load(file)
-    except FileNotFoundError:
-        with open(path, "w") as file:
-            json.dump(default, file)
-        return default
+
+    value = load_cached(path, load)
+    if value is None:
+        write_atomic(path, lambda file: json.dump(default, file))
+        value = load_cached(path, load)
+    return value
+
+
+def parse_log_line(line: str | bytes) -> dict | None:
+    """The log on a line of a JSON Lines store, or None for a blank, torn or corrupt line
+
+    A last line without its newline still counts if it decodes, e.g. after a hand edit.
+    """
+    if not line.strip():
+        return None
+    try:
+        log = json.loads(line)
+    except ValueError:
+        return None
+    return log if isinstance(log, dict) else None
+
+
+def _last_line_end(file, end: int, chunk=4096) -> int:
+    """Offset just past the last newline before `end` in a binary file, or 0 if none"""
+    while end > 0:
+        start = max(0, end - chunk)
+        file.seek(start)
+        newline = file.read(end - start).rfind(b"\n")
+        if newline != -1:
+            return start + newline + 1
+        end = start
+    return 0
+
+
+class LogStore:
+    """Append-only JSON Lines store for stint logs - one record per line
+
+    Logs from the old `logs.json` array are migrated over on first access and the
+    old file is kept as `logs.json.bak`.
+    """
+
+    def __init__(self, path=LOGS_PATH, legacy_path=LEGACY_LOGS_PATH):
+        self.path = path
+        self.legacy_path = legacy_path
+
+    def migrate(self):
+        if os.path.exists(self.path) or not os.path.exists(self.legacy_path):
+            return
+        with data_lock():
+            # Another instance may have migrated while this one waited for the lock
+            if os.path.exists(self.path):
+                return
+            with open(self.legacy_path, "r") as file:
+                logs = json.load(file)
+            self._write(sorted(logs, key=lambda x: x["start"]))
+            os.replace(self.legacy_path, self.legacy_path + ".bak")
+
+    def __iter__(self):
+        """Lazily yields each log, skipping a torn last line left by an interrupted write
+        and any other line that can't be decoded"""
+        self.migrate()
+        try:
+            with open(self.path, "r") as file:
+                for line in file:
+                    log = parse_log_line(line)
+                    if log is not None:
+                        yield log
+        except FileNotFoundError:
+            return
+
+    def append(self, log: dict):
+        self._append(json.dumps(log) + "\n")
+
+    def append_many(self, logs: list[dict]):
+        """Appends a batch of logs in a single write"""
+        self._append("".join(json.dumps(log) + "\n" for log in logs))
+
+    def _append(self, text: str):
+        """Appends `text` on a line of its own
+
+        A last line missing its newline is ended first if it's a whole record, or
+        truncated if it's torn by an interrupted write, so nothing is glued onto it.
+        """
+        self.migrate()
+        with data_lock(), open(self.path, "ab+") as file:
+            end = file.seek(0, os.SEEK_END)
+            if end:
+                file.seek(end - 1)
+                if file.read(1) != b"\n":
+                    line_start = _last_line_end(file, end)
+                    file.seek(line_start)
+                    if parse_log_line(file.read()) is None:
+                        file.truncate(line_start)
+                    else:
+                        file.write(b"\n")
+            file.write(text.encode())
+
+    def compact(self):
+        """Rewrites the store sorted by start time, dropping blank and torn lines"""
+        with data_lock():
+            logs = sorted(self, key=lambda x: x["start"])
+            self._write(logs)
+        return len(logs)
+
+    def _write(self, logs):
+        def write(file):
+            for log in logs:
+                file.write(json.dumps(log) + "\n")
+
+        write_atomic(self.path, write)
+
+
+class SqliteLogStore:
+    """SQLite store for stint logs and the treat bank, indexed on start time and task
+
+    On first use the logs and treat bank are copied over from the JSON files, which are
+    left in place.
+    """
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            import sqlite3
+
+            # Background jobs may open it from the shell's worker thread. They never run
+            # alongside a command, so the connection is only ever used by one thread at once
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS stints (
+                    id INTEGER PRIMARY KEY,
+                    task TEXT NOT NULL,
+                    start INTEGER NOT NULL,
+                    duration INTEGER NOT NULL,
+                    notes TEXT,
+                    treat_picked TEXT
+                );
+                CREATE INDEX IF NOT EXISTS stints_start ON stints (start);
+                CREATE INDEX IF NOT EXISTS stints_task ON stints (task, start);
+                CREATE TABLE IF NOT EXISTS treats (
+                    id INTEGER PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    expires_at REAL
+                );
+                CREATE INDEX IF NOT EXISTS treats_expires_at ON treats (expires_at);
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+                """)
+        return self._conn
+
+    def _migrated(self) -> bool:
+        return bool(
+            self.conn.execute("SELECT 1 FROM meta WHERE key = 'migrated'").fetchone()
+        )
+
+    def migrate(self):
+        if self._migrated():
+            return
+        with data_lock():
+            # Another instance may have migrated while this one waited for the lock
+            if self._migrated():
+                return
+            conn = self.conn
+            treat_bank = get_json(TREAT_BANK_PATH, [])
+            with conn:
+                conn.executemany(
+                    "INSERT INTO stints (task, start, duration, notes, treat_picked) "
+                    "VALUES (:task, :start, :duration, :notes, :treat_picked)",
+                    (
+                        {"notes": None, "treat_picked": None, **log}
+                        for log in LogStore()
+                    ),
+                )
+                conn.executemany(
+                    "INSERT INTO treats (description, expires_at) "
+                    "VALUES (:description, :expires_at)",
+                    treat_bank,
+                )
+                conn.execute("INSERT INTO meta VALUES ('migrated', '1')")
+
+    def __iter__(self):
+        self.migrate()
+        for task, start, duration, notes, treat_picked in self.conn.execute(
+            "SELECT task, start, duration, notes, treat_picked FROM stints "
+            "ORDER BY start"
+        ):
+            yield {
+                "task": task,
+                "start": start,
+                "duration": duration,
+                "notes": notes,
+                "treat_picked": treat_picked,
+            }
+
+    def append(self, log: dict):
+        self.migrate()
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO stints (task, start, duration, notes, treat_picked) "
+                "VALUES (:task, :start, :duration, :notes, :treat_picked)",
+                log,
+            )
+
+    def append_many(self, logs: list[dict]):
+        """Appends a batch of logs in one transaction"""
+        self.migrate()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO stints (task, start, duration, notes, treat_picked) "
+                "VALUES (:task, :start, :duration, :notes, :treat_picked)",
+                logs,
+            )
+
+    def compact(self):
+        self.migrate()
+        self.conn.execute("VACUUM")
+        return self.conn.execute("SELECT COUNT(*) FROM stints").fetchone()[0]
+
+    def last_notes(self, task: str) -> str | None:
+        self.migrate()
+        row = self.conn.execute(
+            "SELECT notes FROM stints WHERE task = ? ORDER BY start DESC LIMIT 1",
+            (task,),
+        ).fetchone()
+        return row and row[0]
+
+    def count(self) -> int:
+        self.migrate()
+        return self.conn.execute("SELECT COUNT(*) FROM stints").fetchone()[0]
+
+    def day_task_totals(self):
+        """Yields (date ordinal, task, seconds), summed per local day and task in SQL"""
+        self.migrate()
+        for day_str, task, total in self.conn.execute(
+            "SELECT date(start, 'unixepoch', 'localtime') AS day, task, SUM(duration) "
+            "FROM stints GROUP BY day, task"
+        ):
+            yield date.fromisoformat(day_str).toordinal(), task, total
+
+    def get_treats(self) -> list[dict]:
+        """Returns the treat bank in expiry order, never-expiring treats last"""
+        self.migrate()
+        return [
+            {"id": treat_id, "description": description, "expires_at": expires_at}
+            for treat_id, description, expires_at in self.conn.execute(
+                "SELECT id, description, expires_at FROM treats "
+                "ORDER BY expires_at IS NULL, expires_at, id"
+            )
+        ]
+
+    def save_treats(self, treat_bank: list[dict]):
+        self.migrate()
+        with self.conn:
+            self.conn.execute("DELETE FROM treats")
+            self.conn.executemany(
+                "INSERT INTO treats (id, description, expires_at) "
+                "VALUES (:id, :description, :expires_at)",
+                treat_bank,
+            )
+
+
+_log_stores: dict[str, LogStore | SqliteLogStore] = {}
+
+
+def get_log_store() -> LogStore | SqliteLogStore:
+    """Returns the store picked by the `storage` setting - `jsonl` (default) or `sqlite`"""
+    storage = get_json().get("storage", "jsonl")
+    if storage not in _log_stores:
+        _log_stores[storage] = SqliteLogStore() if storage == "sqlite" else LogStore()
+    return _log_stores[storage]
+
+
+class Stint:
+    """Read-only view of a single stint in a LogTimeline"""
+
+    __slots__ = ("task", "start", "duration", "notes", "treat_picked")
+
+    def __init__(self, task, start, duration, notes=None, treat_picked=None):
+        self.task: str = task
+        self.start: int = start
+        self.duration: int = duration
+        self.notes: str | None = notes
+        self.treat_picked: str | None = treat_picked
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class LogTimeline:
+    """Columnar stint logs kept sorted by start time
+
+    Starts and durations live in arrays, task names are stored once and referenced by id,
+    and notes and picked treats are kept sparsely by position. Date range lookups are a
+    bisect over `starts`, costing O(log N + results).
+    """
+
+    def __init__(self, logs=()):
+        self.starts = array("q")
+        self.durations = array("q")
+        self.task_ids = array("I")
+        self.tasks: list[str] = []
+        self._task_ids: dict[str, int] = {}
+        self.notes: dict[int, str] = {}
+        self.treats: dict[int, str] = {}
+
+        for log in logs:
+            i = len(self.starts)
+            self.starts.append(log["start"])
+            self.durations.append(log["duration"])
+            self.task_ids.append(self._task_id(log["task"]))
+            if log.get("notes"):
+                self.notes[i] = log["notes"]
+            if log.get("treat_picked"):
+                self.treats[i] = log["treat_picked"]
+
+        if any(a > b for a, b in zip(self.starts, self.starts[1:])):
+            self._sort()
+
+    def _task_id(self, task: str):
+        task_id = self._task_ids.get(task)
+        if task_id is None:
+            task_id = self._task_ids[task] = len(self.tasks)
+            self.tasks.append(task)
+        return task_id
+
+    def _sort(self):
+        order = sorted(range(len(self.starts)), key=self.starts.__getitem__)
+        position = {old: new for new, old in enumerate(order)}
+        self.starts = array("q", (self.starts[i] for i in order))
+        self.durations = array("q", (self.durations[i] for i in order))
+        self.task_ids = array("I", (self.task_ids[i] for i in order))
+        self.notes = {position[i]: n for i, n in self.notes.items()}
+        self.treats = {position[i]: t for i, t in self.treats.items()}
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i: int) -> Stint:
+        return Stint(
+            self.tasks[self.task_ids[i]],
+            self.starts[i],
+            self.durations[i],
+            self.notes.get(i),
+            self.treats.get(i),
+        )
+
+    def __iter__(self):
+        return self.stints(0, len(self))
+
+    def stints(self, lo: int, hi: int):
+        """Yields stint views for positions lo to hi, in start order"""
+        for i in range(lo, hi):
+            yield self[i]
+
+    def add(self, log: dict):
+        i = bisect_right(self.starts, log["start"])
+        if i < len(self.starts):
+            self.notes = {j + (j >= i): n for j, n in self.notes.items()}
+            self.treats = {j + (j >= i): t for j, t in self.treats.items()}
+        self.starts.insert(i, log["start"])
+        self.durations.insert(i, log["duration"])
+        self.task_ids.insert(i, self._task_id(log["task"]))
+        if log.get("notes"):
+            self.notes[i] = log["notes"]
+        if log.get("treat_picked"):
+            self.treats[i] = log["treat_picked"]
+
+    def span(self, start: float, end: float) -> tuple[int, int]:
+        """Returns the positions (lo, hi) of the stints with `start <= stint.start < end`"""
+        return bisect_left(self.starts, start), bisect_left(self.starts, end)
+
+    def between(self, start: float, end: float) -> list[Stint]:
+        return list(self.stints(*self.span(start, end)))
+
+    def select(self, positions) -> "LogTimeline":
+        """A new timeline of just the stints at `positions`, which must be in start order"""
+        timeline = LogTimeline()
+        timeline.starts = array("q", (self.starts[i] for i in positions))
+        timeline.durations = array("q", (self.durations[i] for i in positions))
+        timeline.task_ids = array(
+            "I", (timeline._task_id(self.tasks[self.task_ids[i]]) for i in positions)
+        )
+        for j, i in enumerate(positions):
+            if i in self.notes:
+                timeline.notes[j] = self.notes[i]
+            if i in self.treats:
+                timeline.treats[j] = self.treats[i]
+        return timeline
+
+
+class TaskIndex:
+    """Positions of each task's stints in a timeline, in start order, and each task's total
+
+    Kept current by `add` as stints are appended, so a task's stints, total and last notes
+    are found in O(results) rather than by scanning the history.
+    """
+
+    def __init__(self, timeline: LogTimeline):
+        self.timeline = timeline
+        positions = [array("I") for _ in timeline.tasks]
+        totals = [0] * len(timeline.tasks)
+        for i, (task_id, duration) in enumerate(
+            zip(timeline.task_ids, timeline.durations)
+        ):
+            positions[task_id].append(i)
+            totals[task_id] += duration
+        self.positions: dict[str, array] = dict(zip(timeline.tasks, positions))
+        self.totals: dict[str, int] = dict(zip(timeline.tasks, totals))
+
+    def add(self, log: dict):
+        """Indexes a stint the timeline has just added"""
+        i = bisect_right(self.timeline.starts, log["start"]) - 1
+        if i < len(self.timeline) - 1:
+            # Inserted before later stints, which have all moved up a position
+            for positions in self.positions.values():
+                for j in range(bisect_left(positions, i), len(positions)):
+                    positions[j] += 1
+        insort(self.positions.setdefault(log["task"], array("I")), i)
+        self.totals[log["task"]] = self.totals.get(log["task"], 0) + log["duration"]
+
+    def last_notes(self, task: str) -> str | None:
+        """Notes left on the most recent stint of a task"""
+        positions = self.positions.get(task)
+        return self.timeline.notes.get(positions[-1]) if positions else None
+
+    def timeline_of(self, task: str) -> LogTimeline:
+        return self.timeline.select(self.positions.get(task, ()))
+
+
+def get_timeline() -> LogTimeline:
+    store = get_log_store()
+    store.migrate()
+    timeline = load_cached(store.path, lambda: LogTimeline(store))
+    return LogTimeline() if timeline is None else timeline
 
 
 def get_logs() -> list[dict]:
-    return get_json(LOGS_PATH, [])
+    return [stint.to_dict() for stint in get_timeline()]
+
+
+# name -> (logs file key, object derived from the log store)
+_derived_cache: dict[str, tuple[tuple[int, int] | None, object]] = {}
+
+
+def _get_derived(name: str, build):
+    """Returns `build()`, rebuilt only when the log file changes
+
+    Derived objects must have an `add(log)` method so `append_log` can keep them current.
+    """
+    get_log_store().migrate()
+    key = _file_key(get_log_store().path)
+    cached = _derived_cache.get(name)
+    if cached and cached[0] == key and key is not None:
+        return cached[1]
+    value = build()
+    _derived_cache[name] = (key, value)
+    return value
+
+
+def get_day_index() -> "DayIndex":
+    store = get_log_store()
+    if isinstance(store, SqliteLogStore):
+        return _get_derived(
+            "day_index",
+            lambda: DayIndex.from_totals(store.day_task_totals(), store.count()),
+        )
+    return _get_derived("day_index", lambda: load_day_index(store))
+
+
+def get_task_index() -> TaskIndex:
+    return _get_derived("task_index", lambda: TaskIndex(get_timeline()))
+
+
+def get_project_timeline(project: str | None = None) -> LogTimeline:
+    """The whole timeline, or just the stints of `project`"""
+    return get_timeline() if project is None else get_task_index().timeline_of(project)
+
+
+def get_last_notes(task: str) -> str | None:
+    store = get_log_store()
+    if isinstance(store, SqliteLogStore):
+        return store.last_notes(task)
+    return get_task_index().last_notes(task)
+
+
+class TreatBank:
+    """Banked treats kept ordered by expiry, with never-expiring treats last
+
+    Each treat gets a stable integer id. Expired treats are a prefix of the order, so
+    purging them and finding a treat to redeem are bisects rather than scans.
+    """
+
+    def __init__(self, treats=()):
+        # Sorted (expiry, id) keys, with None expiries sorted last as infinity
+        self._keys: list[tuple[float, int]] = []
+        self._treats: dict[int, dict] = {}
+        self._next_id = 1 + max((t.get("id") or 0 for t in treats), default=0)
+
+        for treat in treats:
+            treat = dict(treat)
+            if not treat.get("id"):
+                treat["id"] = self._new_id()
+            self._treats[treat["id"]] = treat
+            self._keys.append(self._key(treat))
+        if any(a > b for a, b in zip(self._keys, self._keys[1:])):
+            self._keys.sort()
+
+    def _new_id(self):
+        self._next_id += 1
+        return self._next_id - 1
+
+    @staticmethod
+    def _key(treat: dict):
+        return (treat["expires_at"] or float("inf"), treat["id"])
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        """Yields treats in expiry order"""
+        return (self._treats[treat_id] for _, treat_id in self._keys)
+
+    def add(self, description: str, expires_at: float | None) -> dict:
+        treat = {
+            "id": self._new_id(),
+            "description": description,
+            "expires_at": expires_at,
+        }
+        self._treats[treat["id"]] = treat
+        insort(self._keys, self._key(treat))
+        return treat
+
+    def purge_expired(self, now: float) -> list[dict]:
+        """Removes and returns the treats that expired before `now`"""
+        num_expired = bisect_left(self._keys, (now,))
+        expired = [
+            self._treats.pop(treat_id) for _, treat_id in self._keys[:num_expired]
+        ]
+        del self._keys[:num_expired]
+        return expired
+
+    def redeem(self, treat_id: int) -> dict:
+        treat = self._treats.pop(treat_id)
+        del self._keys[bisect_left(self._keys, self._key(treat))]
+        return treat
+
+    def to_list(self) -> list[dict]:
+        return list(self)
+
+
+def get_treat_bank() -> TreatBank:
+    store = get_log_store()
+    if isinstance(store, SqliteLogStore):
+        return TreatBank(store.get_treats())
+    return TreatBank(get_json(TREAT_BANK_PATH, []))
+
+
+def save_treat_bank(treat_bank: TreatBank):
+    store = get_log_store()
+    if isinstance(store, SqliteLogStore):
+        store.save_treats(treat_bank.to_list())
+    else:
+        save_json(treat_bank.to_list(), TREAT_BANK_PATH)
+
+
+def append_log(log: dict):
+    """Appends a stint to the log store, updating the cached timeline and derived objects in place"""
+    store = get_log_store()
+    with data_lock():
+        key = _file_key(store.path)
+        store.append(log)
+        new_key = _file_key(store.path)
+    if key is None:
+        return
+
+    cached = _file_cache.get(store.path)
+    if cached and cached[0] == key:
+        cached[1].add(log)
+        _file_cache[store.path] = (new_key, cached[1])
+    for name, (derived_key, value) in list(_derived_cache.items()):
+        if derived_key == key:
+            value.add(log)
+            _derived_cache[name] = (new_key, value)
+
+
+def _process_started(pid: int) -> str | None:
+    """When process `pid` started, as "boot id:clock ticks since boot", or None if it
+    isn't running or the platform has no /proc (Linux only)"""
+    try:
+        with open("/proc/sys/kernel/random/boot_id", "r") as file:
+            boot_id = file.read().strip()
+        with open(f"/proc/{pid}/stat", "r") as file:
+            # Fields after the parenthesized command name, which may itself hold spaces
+            fields = file.read().rpartition(")")[2].split()
+    except OSError:
+        return None
+    return f"{boot_id}:{fields[19]}"
+
+
+# Tells this instance apart from an earlier one that had the same pid
+_instance_id = f"{os.getpid()}-{time.time_ns()}"
+
+
+class StintJournal:
+    """Record of the stint in progress, so it can be recovered if the app dies mid-stint
+
+    A heartbeat is written every `interval` seconds. Only the first and last records are
+    fsynced - the heartbeats in between survive the process being killed, and a power cut
+    loses at most the last few of them.
+    """
+
+    def __init__(self, task: str, start: float, interval: int):
+        self.path = os.path.join(JOURNAL_DIR, f"{_instance_id}.json")
+        self.interval = interval
+        self.record = {
+            "pid": os.getpid(),
+            "instance": _instance_id,
+            "started": _process_started(os.getpid()),
+            "task": task,
+            "start": start,
+            "end": None,
+            "heartbeat": start,
+            "interval": interval,
+        }
+        self._heartbeat = None
+
+    def write(self, fsync=False):
+        write_atomic(self.path, lambda file: json.dump(self.record, file), fsync)
+
+    def start(self):
+        import asyncio
+
+        os.makedirs(JOURNAL_DIR, exist_ok=True)
+        self.write(fsync=True)
+        self._heartbeat = asyncio.create_task(self._beat())
+
+    async def _beat(self):
+        import asyncio
+
+        while True:
+            await asyncio.sleep(self.interval)
+            self.record["heartbeat"] = time.time()
+            self.write()
+
+    def end(self, end_time: float):
+        """Records when the stint ended, while its notes and treat are still being asked for"""
+        self.record["end"] = self.record["heartbeat"] = end_time
+        self.write(fsync=True)
+
+    def discard(self):
+        if self._heartbeat:
+            self._heartbeat.cancel()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _instance_gone(record: dict):
+    """Whether the instance that journaled a stint has exited without logging it
+
+    Pids are reused, e.g. after a reboot or container restart, so a running process with
+    the same pid is only the same instance if it started at the same time. Where that
+    can't be told (no /proc), a heartbeat that stopped mid-stint gives it away.
+    """
+    if record.get("started") is not None:
+        return _process_started(record["pid"]) != record["started"]
+    heartbeat_stopped = record["end"] is None and (
+        time.time() - record["heartbeat"] > 3 * record["interval"]
+    )
+    if sys.platform.startswith("win"):
+        # There's no harmless way to probe a process there
+        return heartbeat_stopped
+    try:
+        os.kill(record["pid"], 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return heartbeat_stopped
+
+
+def get_orphaned_stints() -> list[tuple[str, dict]]:
+    """Journaled stints whose instance has exited without logging them"""
+    try:
+        names = sorted(os.listdir(JOURNAL_DIR))
+    except FileNotFoundError:
+        return []
+
+    orphans = []
+    for name in names:
+        path = os.path.join(JOURNAL_DIR, name)
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(path, "r") as file:
+                record = json.load(file)
+        except (OSError, ValueError):
+            continue
+        if record.get("instance") == _instance_id:
+            continue
+        if _instance_gone(record):
+            orphans.append((path, record))
+    return orphans
+
+
+def recover_stints():
+    """Offers to log the stints left behind by instances that died mid-stint, up to
+    their last heartbeat"""
+    orphans = get_orphaned_stints()
+    if not orphans:
+        return
+    min_stint_secs = time_to_seconds(get_json()["min_stint_time"])
+
+    for path, record in orphans:
+        end = record["end"] or record["heartbeat"]
+        duration = round(end - record["start"])
+        recover = False
+        if duration >= min_stint_secs:
+            started = time.strftime("%a %d %b %H:%M", time.localtime(record["start"]))
+            answer = input(
+                f"\nFound an unfinished {record['task']} stint from {started}, lasting "
+                f"{seconds_to_time(duration)}. Recover it? (y/n) "
+            )
+            recover = answer.lower().find("y") != -1
+
+        with data_lock():
+            # Another instance may have dealt with it while this one was asking
+            if not os.path.exists(path):
+                continue
+            if recover:
+                stint = {
+                    "task": record["task"],
+                    "start": round(record["start"]),
+                    "duration": duration,
+                    "notes": None,
+                    "treat_picked": None,
+                }
+                append_log(stint)
+                print("\nStint recovered!\n")
+                update_treats(stint=stint)
+            os.remove(path)
+
+
+def midnight(day_ordinal: int):
+    """Epoch time of local midnight at the start of a date ordinal"""
+    return time.mktime(date.fromordinal(day_ordinal).timetuple())
+
+
+def _local_midnights(first_day: int, last_day: int, step=14) -> list[int]:
+    """Local midnights at the start of each day from `first_day` through `last_day`
+
+    Days are 24 hours long except across a UTC offset change, so mktime is only asked for
+    every `step`th midnight, and for every day of a step whose length is off. `step` is
+    short enough that no two offset changes (e.g. DST suspended for Ramadan) cancel out.
+    """
+    midnights = []
+    start = int(midnight(first_day))
+    for d in range(first_day, last_day + 1, step):
+        num_days = min(step, last_day + 1 - d)
+        end = int(midnight(d + num_days))
+        if end - start == num_days * day:
+            midnights.extend(range(start, end, day))
+        else:
+            midnights.extend(int(midnight(d + i)) for i in range(num_days))
+        start = end
+    return midnights
+
+
+class DayTable:
+    """Cached local midnights of a range of days, grown to cover the days asked about
+
+    Maps timestamps to local days with a bisect instead of a localtime call each, while
+    still getting the days around DST changes right.
+    """
+
+    def __init__(self):
+        self.first_day = 0
+        # Midnight at the start of each day from first_day, and the one ending the last
+        self.midnights: list[int] = []
+
+    def cover(self, first_day: int, last_day: int):
+        if not self.midnights:
+            self.first_day = first_day
+            self.midnights = _local_midnights(first_day, last_day + 1)
+            return
+        if first_day < self.first_day:
+            self.midnights[:0] = _local_midnights(first_day, self.first_day - 1)
+            self.first_day = first_day
+        end_day = self.first_day + len(self.midnights) - 1
+        if last_day >= end_day:
+            self.midnights += _local_midnights(end_day + 1, last_day + 1)
+
+    def day_of(self, timestamp: float) -> int:
+        """Date ordinal of the local day `timestamp` falls on"""
+        i = bisect_right(self.midnights, timestamp) - 1
+        if 0 <= i < len(self.midnights) - 1:
+            return self.first_day + i
+        day_ordinal = date.fromtimestamp(timestamp).toordinal()
+        # Cover through today too, so logging day by day doesn't grow the table each time
+        today = date.today().toordinal()
+        self.cover(min(day_ordinal, today), max(day_ordinal, today))
+        return day_ordinal
+
+    def day_spans(self, starts, lo=0, hi=None):
+        """Yields (date ordinal, lo, hi) for each local day with stints in `starts[lo:hi]`
+
+        `starts` must be sorted, so each day's stints are found with one bisect into it.
+        """
+        hi = len(starts) if hi is None else hi
+        while lo < hi:
+            day_ordinal = self.day_of(starts[lo])
+            day_end = self.midnights[day_ordinal - self.first_day + 1]
+            end = bisect_left(starts, day_end, lo, hi)
+            yield day_ordinal, lo, end
+            lo = end
+
+    def midnights_between(self, first_day: int, last_day: int) -> list[int]:
+        """Midnights starting each day from `first_day` through `last_day`, and ending it"""
+        self.cover(first_day, last_day)
+        lo = first_day - self.first_day
+        return self.midnights[lo : lo + last_day - first_day + 2]
+
+
+_day_table = DayTable()
+
+
+def local_day(timestamp: float) -> int:
+    """Date ordinal of the local day `timestamp` falls on, looked up in the day table"""
+    return _day_table.day_of(timestamp)
 
 
 def get_today_secs():
@@ -196,9 +1227,82 @@ def get_today_secs():
     return current_time.tm_hour * 3600 + current_time.tm_min * 60 + current_time.tm_sec
 
 
+class AudioPlayer:
+    """Plays sound cues one after another on a single long-lived worker thread
+
+    The worker reads every sound file once when it starts, so later cues are played from
+    the page cache. If playsound can't be imported or fails to play (e.g. on a headless
+    machine) the player carries on with a silent backend. The delay between each cue
+    being queued and starting to play is kept in `latencies`.
+    """
+
+    def __init__(self, paths=()):
+        self.paths = paths
+        self.latencies: list[float] = []
+        self.on_latency = None
+        self.backend = None
+        self._queue = None
+
+    def start(self):
+        if self._queue is not None:
+            return
+        from queue import SimpleQueue
+        from threading import Thread
+
+        self._queue = SimpleQueue()
+        Thread(target=self._run, daemon=True).start()
+
+    def play(self, path: str):
+        """Queues a cue and returns straight away"""
+        self.start()
+        self._queue.put((path, time.perf_counter()))
+
+    def _run(self):
+        self.backend = self._load_backend()
+        for path in self.paths:
+            try:
+                with open(path, "rb") as file:
+                    file.read()
+            except OSError:
+                pass
+
+        while True:
+            path, queued_at = self._queue.get()
+            latency = time.perf_counter() - queued_at
+            self.latencies.append(latency)
+            if self.on_latency:
+                self.on_latency(latency)
+            try:
+                self.backend(path)
+            except Exception:
+                self.backend = self._silent
+
+    def _load_backend(self):
+        try:
+            from playsound import playsound
+        except ImportError:
+            return self._silent
+        return playsound
+
+    @staticmethod
+    def _silent(path: str):
+        pass
+
+
+_audio = AudioPlayer([SUCCESS_PATH, FIVE_MINS_LEFT_PATH, STINT_ENDED_PATH])
+
+
+def play_sound(path: str):
+    _audio.play(path)
+
+
 async def start_stint_async():
+    import asyncio
+    import questionary
+
     settings = get_json()
-    logs = get_logs()
+    # Loads the sounds in the background while a task is picked
+    _audio.start()
 
     end_secs = time_to_seconds(settings["end_stint_at"])
     min_stint_secs = time_to_seconds(settings["min_stint_time"])
@@ -216,123 +1320,380 @@ async def start_stint_async():
         selected = input("Describe the task: ")
         add_task = input("Add task to stint options? (y/n) ")
         if add_task.lower().find("y") != -1:
-            settings["projects"].append(selected)
-            save_json(settings)
+            with data_lock():
+                settings = get_json()
+                settings["projects"].append(selected)
+                save_json(settings)
 
-    last_stint = next((log for log in reversed(logs) if log["task"] == selected), None)
-    if last_stint and last_stint.get("notes"):
+    last_notes = get_last_notes(selected)
+    if last_notes:
         print()
-        print_pretty(f"Notes from last time: {last_stint['notes']}")
+        print_pretty(f"Notes from last time: {last_notes}")
+
+    start_time = time.time()
+    journal = StintJournal(
+        selected,
+        start_time,
+        time_to_seconds(settings.get("checkpoint_interval", "1:00")),
+    )
+    journal.start()
+
+    # Only stints canceled from here are discarded - if the process is killed instead, the
+    # journal is left for recover_stints to find
+    try:
+        await sleep_verbose(
+            min_stint_secs, "Time until valid", "Stint valid!", "Stint canceled"
+        )
+        play_sound(SUCCESS_PATH)
+        try:
+            await stop_watch(
+                stop_message="end the stint",
+                end_message="Logging stint",
+                start_time=start_time,
+                time_limit=end_secs - get_today_secs() + min_stint_secs,
+            )
+        except asyncio.CancelledError:
+            pass
+
+        end_time = time.time()
+        journal.end(end_time)
+
+        notes = input("\nNotes to future self (optional): ").strip()
+        print()
+
+        treat_selected: str = await questionary.select(
+            f"Select treat{f" (max duration: {settings['treats_after_stint']['max_duration']})"
+            if settings['treats_after_stint'].get('max_duration')
+            else ''}:",
+            choices=["No treat", *settings["treats_after_stint"]["treats"]],
+        ).ask_async()
+
+        stint = {
+            "task": selected,
+            "start": round(start_time),
+            "duration": round(end_time - start_time),
+            "notes": notes or None,
+            "treat_picked": None if treat_selected == "No treat" else treat_selected,
+        }
+        # Treats are evaluated against the settings and bank as they are now, not as they
+        # were when the stint started - another instance may have changed them since
+        with data_lock():
+            append_log(stint)
+            journal.discard()
+            print("\nStint Saved!\n")
+
+            update_treats(stint=stint)
+    except (KeyboardInterrupt, SystemExit, asyncio.CancelledError):
+        journal.discard()
+        raise
+
+
+def treat_id(treat: dict, scope: str) -> str:
+    """Stable id for a treat in settings - its `id` if given, else a hash of its definition"""
+    if treat.get("id"):
+        return treat["id"]
+    import hashlib
+
+    definition = json.dumps([scope, treat], sort_keys=True)
+    return hashlib.sha1(definition.encode()).hexdigest()[:12]
+
+
+def get_crossed_treats(treats: list[dict], seconds: int) -> list[dict]:
+    """Returns the treats whose hours threshold is at or below `seconds`
+
+    `treats` is sorted by hours in place (and so stays sorted once saved), which lets the
+    crossed thresholds be found with a bisect.
+    """
+    treats.sort(key=lambda x: x["hours"])
+    return treats[: bisect_right(treats, seconds / 3600, key=lambda x: x["hours"])]
+
+
+def get_window_start(unit: str, amount: int, today: int) -> int:
+    """First day (date ordinal) of the current `amount` day or week high score window"""
+    if unit == "day":
+        return today - amount + 1
+    return today - (today - 1) % 7 - (amount - 1) * 7
+
+
+@data_lock()
+def update_treats(
+    timeline: LogTimeline | None = None, settings=None, stint: dict | None = None
+):
+    """Banks every treat whose threshold has been reached and removes it from settings
+
+    The totals evaluated last time are kept in `treat_state.json`. When `stint` is the only
+    stint logged since then, the total and each interval's current window are updated
+    with it instead of being recomputed from the history.
+    """
+    index = get_day_index() if timeline is None else None
+    count = index.count if timeline is None else len(timeline)
+    settings = get_json() if settings is None else settings
+    state = get_json(TREAT_STATE_PATH, {})
+    treat_bank = get_treat_bank()
+    now = time.time()
+    today = date.today().toordinal()
+
+    incremental = stint is not None and state.get("count") == count - 1
+    stint_day = stint and local_day(stint["start"])
+
+    def earn(treats: list[dict], seconds: int, scope: str):
+        earned_treats = get_crossed_treats(treats, seconds)
+        for treat in earned_treats:
+            expires_at = treat["treat"].get("grace_period") and (
+                now + time_to_seconds(treat["treat"]["grace_period"])
+            )
+            treat_bank.add(treat["treat"]["description"], expires_at)
+            print(f"\nEarned treat: {treat['treat']['description']}\n")
+        earned_ids = {treat_id(t, scope) for t in earned_treats}
+        return [t for t in treats if treat_id(t, scope) not in earned_ids]
+
+    if incremental:
+        total_duration = state["total"] + stint["duration"]
+    elif index is not None:
+        total_duration = index.total
+    else:
+        total_duration = get_total_duration(timeline)
+
+    if settings.get("total_time_treats"):
+        settings["total_time_treats"] = earn(
+            settings["total_time_treats"], total_duration, "total"
+        )
+
+    windows = {}
+    for interval in settings.get("high_score_intervals", []):
+        scope = f"{interval['unit']}:{interval['amount']}"
+        window_start = get_window_start(interval["unit"], interval["amount"], today)
+        last = state.get("windows", {}).get(scope)
+
+        if incremental and last and last["start"] == window_start:
+            current = last["current"]
+            if stint_day >= window_start:
+                current += stint["duration"]
+        else:
+            index = DayIndex(timeline) if index is None else index
+            current = sum(
+                index.totals.get(d, 0) for d in range(window_start, today + 1)
+            )
+        windows[scope] = {"start": window_start, "current": current}
+
+        if interval.get("treats"):
+            interval["treats"] = earn(interval["treats"], current, scope)
+
+    save_treat_bank(treat_bank)
+    save_json(settings, SETTINGS_PATH)
+    save_json(
+        {"count": count, "total": total_duration, "windows": windows},
+        TREAT_STATE_PATH,
+    )
+
+
+def start_stint():
+    import asyncio
+
+    try:
+        asyncio.run(start_stint_async())
+    except KeyboardInterrupt:
+        pass
+
+
+def compact_logs():
+    num_logs = get_log_store().compact()
+    print(f"\nCompacted log store - {num_logs} stints\n")
+
+
+# Import - streams exports from other trackers through parse, normalize, dedupe and append
+
+
+def parse_timestamp(value) -> float:
+    """Epoch seconds from epoch seconds or an ISO 8601 date and time (local if naive)"""
+    if isinstance(value, (int, float)):
+        return value
+    value = str(value).strip()
+    if value.replace(".", "", 1).isdigit():
+        return float(value)
+    return datetime.fromisoformat(value).timestamp()
+
+
+def parse_duration(value) -> int:
+    """Seconds from a number of seconds or a time string like 1:30:00"""
+    if isinstance(value, (int, float)):
+        return round(value)
+    value = str(value).strip()
+    return round(float(value)) if ":" not in value else time_to_seconds(value)
+
+
+def normalize_record(record: dict) -> dict:
+    """Maps an imported record onto a stint, accepting a few common field names
 
-    start_time = time.time()
+    Raises KeyError or ValueError if it has no task, start, or duration or end.
+    """
 
-    await sleep_verbose(
-        min_stint_secs, "Time until valid", "Stint valid!", "Stint canceled"
-    )
-    to_thread(playsound, SUCCESS_PATH)
-    try:
-        await stop_watch(
-            stop_message="end the stint",
-            end_message="Logging stint",
-            start_time=start_time,
-            time_limit=end_secs - get_today_secs() + min_stint_secs,
+    def field(*names):
+        for name in names:
+            if record.get(name) not in (None, ""):
+                return record[name]
+        return None
+
+    task = field("task", "project", "summary")
+    start = parse_timestamp(field("start", "start_time", "started_at", "dtstart"))
+    duration = field("duration")
+    if duration is None:
+        duration = (
+            parse_timestamp(field("end", "end_time", "ended_at", "dtend")) - start
         )
-    except asyncio.CancelledError:
-        pass
+    duration = parse_duration(duration)
+    if not task or duration <= 0:
+        raise ValueError("Record has no task or no duration")
+    return {
+        "task": str(task).strip(),
+        "start": round(start),
+        "duration": duration,
+        "notes": field("notes", "description") or None,
+        "treat_picked": None,
+    }
 
-    end_time = time.time()
 
-    notes = input("\nNotes to future self (optional): ").strip()
-    print()
+def parse_csv(file):
+    import csv
 
-    treat_selected: str = await questionary.select(
-        f"Select treat{f" (max duration: {settings['treats_after_stint']['max_duration']})"
-        if settings['treats_after_stint'].get('max_duration')
-        else ''}:",
-        choices=["No treat", *settings["treats_after_stint"]["treats"]],
-    ).ask_async()
+    yield from csv.DictReader(file)
 
-    with open(LOGS_PATH, "r") as file:
-        logs: list = json.load(file)
 
-    logs.append(
-        {
-            "task": selected,
-            "start": round(start_time),
-            "duration": round(end_time - start_time),
-            "notes": notes or None,
-            "treat_picked": None if treat_selected == "No treat" else treat_selected,
-        }
-    )
-    save_json(logs, LOGS_PATH)
-    print("\nStint Saved!\n")
+def parse_ndjson(file):
+    for line in file:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield {"invalid": True}
 
-    update_treats(logs, settings)
 
+def parse_ics(file):
+    """Yields the VEVENTs of an iCalendar file as records, unfolding continued lines"""
+    import re
 
-def update_treats(logs=get_logs(), settings=get_json()):
-    treat_bank = get_json(TREAT_BANK_PATH, [])
-    now = time.time()
+    def timestamp(value: str):
+        if "T" not in value:
+            raise ValueError("All-day events have no duration")
+        parsed = datetime.strptime(value.rstrip("Z"), "%Y%m%dT%H%M%S")
+        if value.endswith("Z"):
+            return parsed.replace(tzinfo=timezone.utc).timestamp()
+        return parsed.timestamp()
 
-    total_duration = get_total_duration(logs)
+    def duration(value: str):
+        match = re.fullmatch(
+            r"P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?", value
+        )
+        weeks_, days_, hours, minutes, seconds = (int(x or 0) for x in match.groups())
+        return (((weeks_ * 7 + days_) * 24 + hours) * 60 + minutes) * 60 + seconds
+
+    event, line = None, ""
+    for next_line in file:
+        next_line = next_line.rstrip("\r\n")
+        if next_line[:1] in (" ", "\t"):
+            line += next_line[1:]
+            continue
+        name, _, value = line.partition(":")
+        name = name.split(";")[0].upper()
+        if name == "BEGIN" and value == "VEVENT":
+            event = {}
+        elif name == "END" and value == "VEVENT" and event is not None:
+            yield event
+            event = None
+        elif event is not None:
+            try:
+                if name == "SUMMARY":
+                    event["task"] = value
+                elif name == "DESCRIPTION":
+                    event["notes"] = value.replace("\\n", "\n").replace("\\,", ",")
+                elif name in ("DTSTART", "DTEND"):
+                    event[name.lower()] = timestamp(value)
+                elif name == "DURATION":
+                    event["duration"] = duration(value)
+            except (ValueError, AttributeError):
+                event["invalid"] = True
+        line = next_line
+    if line.upper() == "END:VEVENT" and event is not None:
+        yield event
 
-    if settings.get("total_time_treats"):
-        earned_treats = []
-        for treat in settings["total_time_treats"]:
-            hours_threshold = treat["hours"] * 3600
-            if total_duration >= hours_threshold:
-                expires_at = treat["treat"].get("grace_period") and (
-                    now + time_to_seconds(treat["treat"]["grace_period"])
-                )
-                treat_bank.append(
-                    {
-                        "description": treat["treat"]["description"],
-                        "expires_at": expires_at,
-                    }
-                )
-                print(f"\nEarned treat: {treat['treat']['description']}\n")
-                earned_treats.append(treat)
 
-        settings["total_time_treats"] = [
-            t for t in settings["total_time_treats"] if t not in earned_treats
-        ]
+importers = {"csv": parse_csv, "ndjson": parse_ndjson, "ics": parse_ics}
 
-    if settings.get("high_score_intervals"):
-        for interval in settings["high_score_intervals"]:
-            if not interval.get("treats"):
-                continue
 
-            scores = get_high_score(logs, interval["unit"], interval["amount"])
+def _stint_hash(task: str, start: int, duration: int) -> int:
+    """64-bit digest of a stint's identity, kept instead of the tuple to bound memory"""
+    import hashlib
 
-            earned_treats = []
-            for treat in interval["treats"]:
-                hours_threshold = treat["hours"] * 3600
-                if scores["current"] >= hours_threshold:
-                    expires_at = treat["treat"].get("grace_period") and (
-                        now + time_to_seconds(treat["treat"]["grace_period"])
-                    )
-                    treat_bank.append(
-                        {
-                            "description": treat["treat"]["description"],
-                            "expires_at": expires_at,
-                        }
-                    )
-                    print(f"\nEarned treat: {treat['treat']['description']}\n")
-                    earned_treats.append(treat)
+    digest = hashlib.blake2b(f"{task}\0{start}\0{duration}".encode(), digest_size=8)
+    return int.from_bytes(digest.digest())
 
-            interval["treats"] = [
-                t for t in interval["treats"] if t not in earned_treats
-            ]
 
-    save_json(treat_bank, TREAT_BANK_PATH)
-    save_json(settings, SETTINGS_PATH)
+def import_logs(path: str, format: str | None = None, batch_size=10_000):
+    """Imports the stints in a CSV, NDJSON or iCalendar export, skipping any already logged
 
+    Records are streamed and appended in batches, so memory is bounded by the batch and the
+    set of stint hashes. Treats are evaluated once at the end.
+    """
+    format = format or os.path.splitext(path)[1].lstrip(".").lower()
+    format = {"jsonl": "ndjson", "ical": "ics"}.get(format, format)
+    if format not in importers:
+        print(f"\nUnknown format '{format}' - use one of: {', '.join(importers)}\n")
+        return
 
-def start_stint():
-    try:
-        asyncio.run(start_stint_async())
-    except KeyboardInterrupt:
-        pass
+    timeline = get_timeline()
+    seen = {
+        _stint_hash(timeline.tasks[task_id], start, duration)
+        for task_id, start, duration in zip(
+            timeline.task_ids, timeline.starts, timeline.durations
+        )
+    }
+    store = get_log_store()
+    counts = {"read": 0, "imported": 0, "duplicates": 0, "invalid": 0}
+    batch = []
+    started_at = time.perf_counter()
+
+    def commit():
+        store.append_many(batch)
+        counts["imported"] += len(batch)
+        batch.clear()
+        rate = counts["read"] / (time.perf_counter() - started_at)
+        print(
+            f"\r{counts['read']} read, {counts['imported']} imported - {rate:,.0f} rows/s",
+            end="",
+            flush=True,
+        )
+
+    with open(path, "r", newline="" if format == "csv" else None) as file:
+        for record in importers[format](file):
+            counts["read"] += 1
+            try:
+                if not isinstance(record, dict) or record.get("invalid"):
+                    raise ValueError("Record couldn't be parsed")
+                stint = normalize_record(record)
+            except (KeyError, ValueError, TypeError):
+                counts["invalid"] += 1
+                continue
+
+            key = _stint_hash(stint["task"], stint["start"], stint["duration"])
+            if key in seen:
+                counts["duplicates"] += 1
+                continue
+            seen.add(key)
+            batch.append(stint)
+            if len(batch) >= batch_size:
+                commit()
+    if batch:
+        commit()
+
+    elapsed = time.perf_counter() - started_at
+    print(
+        ("\n" if counts["imported"] else "")
+        + f"\nImported {counts['imported']} of {counts['read']} records in "
+        f"{elapsed:.1f}s ({counts['read'] / max(elapsed, 1e-9):,.0f} rows/s) - "
+        f"{counts['duplicates']} duplicates and {counts['invalid']} invalid skipped\n"
+    )
+    if counts["imported"]:
+        update_treats()
 
 
 def clear_console():
@@ -347,6 +1708,8 @@ def clear_console():
 
 def print_pretty(text: str, indent: int = 2, padding: int = 2):
     """Prints text wrapped to terminal width with proper indentation and padding."""
+    import shutil
+
     terminal_width = shutil.get_terminal_size().columns
     max_width = terminal_width - indent - padding
 
@@ -423,6 +1786,9 @@ def print_rich_bar_chart(
     justify_labels: Literal["left", "right"] = "left",
     start_at_label: int | None = None,
 ):
+    from rich.console import Console
+    from rich.table import Table
+
     console = Console()
     table = Table(title=title, show_header=False, box=None)
 
@@ -458,15 +1824,156 @@ def print_rich_bar_chart(
     console.print(table)
 
 
-def get_week_data(week_start, logs_list, is_first=False, is_last=False):
+class DayIndex:
+    """Stint seconds per local day, keyed by date ordinal, built in one pass over the timeline"""
+
+    def __init__(self, timeline: LogTimeline | None = None, lo=0, hi=None):
+        self.totals: dict[int, int] = {}
+        self.task_totals: dict[int, dict[str, int]] = {}
+        self.first_day: int | None = None
+        self.count = 0
+        self.total = 0
+        if timeline is None:
+            return
+
+        tasks, task_ids = timeline.tasks, timeline.task_ids
+        starts, durations = timeline.starts, timeline.durations
+        for day, day_lo, day_hi in _day_table.day_spans(starts, lo, hi):
+            day_tasks = self.task_totals.setdefault(day, {})
+            for i in range(day_lo, day_hi):
+                task = tasks[task_ids[i]]
+                day_tasks[task] = day_tasks.get(task, 0) + durations[i]
+            total = sum(durations[day_lo:day_hi])
+            self.totals[day] = self.totals.get(day, 0) + total
+            self.total += total
+            self.count += day_hi - day_lo
+            if self.first_day is None or day < self.first_day:
+                self.first_day = day
+
+    @classmethod
+    def from_totals(cls, rows, count=0):
+        """Builds an index of `count` stints from already aggregated
+        (date ordinal, task, seconds) rows"""
+        index = cls()
+        index.count = count
+        for day, task, total in rows:
+            index.totals[day] = index.totals.get(day, 0) + total
+            index.task_totals.setdefault(day, {})[task] = total
+            index.total += total
+            if index.first_day is None or day < index.first_day:
+                index.first_day = day
+        return index
+
+    @classmethod
+    def from_json(cls, data: dict):
+        rows = (
+            (int(day), task, total)
+            for day, tasks in data["days"].items()
+            for task, total in tasks.items()
+        )
+        return cls.from_totals(rows, data["count"])
+
+    def to_json(self) -> dict:
+        return {"count": self.count, "days": self.task_totals}
+
+    def add(self, log: dict):
+        self._add_day(local_day(log["start"]), log["duration"], log["task"])
+
+    def _add_day(self, day: int, duration: int, task: str):
+        self.count += 1
+        self.total += duration
+        self.totals[day] = self.totals.get(day, 0) + duration
+        tasks = self.task_totals.setdefault(day, {})
+        tasks[task] = tasks.get(task, 0) + duration
+        if self.first_day is None or day < self.first_day:
+            self.first_day = day
+
+
+# Bumped whenever the layout of aggregates.json changes, to rebuild it
+AGGREGATES_VERSION = 3
+
+
+def _tail_digest(file, size: int, window=1 << 16) -> str:
+    """blake2b hash of the `window` bytes of `file` that end at offset `size`"""
+    import hashlib
+
+    start = max(size - window, 0)
+    file.seek(start)
+    return hashlib.blake2b(file.read(size - start), digest_size=16).hexdigest()
+
+
+def load_day_index(store: LogStore) -> DayIndex:
+    """Day index of a JSON Lines store, kept on disk in `aggregates.json`
+
+    The sidecar holds the totals of the first `size` bytes of the store, so only stints
+    appended since it was written - new stints and imports - are read and added. Every
+    rewrite of the store (compaction, import of a legacy file) replaces it with a new
+    file, so the sidecar is checked against the store's inode, plus a hash of the bytes
+    just before `size` to catch edits in place; otherwise the index is rebuilt.
+    """
+    try:
+        file = open(store.path, "rb")
+    except FileNotFoundError:
+        return DayIndex()
+
+    with file:
+        stat = os.fstat(file.fileno())
+        cache = get_json(AGGREGATES_PATH, {})
+        size = cache.get("size", 0)
+        valid = (
+            cache.get("version") == AGGREGATES_VERSION
+            and cache.get("device") == stat.st_dev
+            and cache.get("inode") == stat.st_ino
+            and size <= stat.st_size
+            and cache.get("checksum") == _tail_digest(file, size)
+        )
+        if valid:
+            index, offset = DayIndex.from_json(cache), size
+        else:
+            index, offset = DayIndex(), 0
+
+        file.seek(offset)
+        for line in file:
+            log = parse_log_line(line)
+            # Stop at a torn last line, it's read once the write completes
+            if log is None and not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            if log is not None:
+                index.add(log)
+
+        if offset != size or not valid:
+            aggregates = {
+                "version": AGGREGATES_VERSION,
+                "device": stat.st_dev,
+                "inode": stat.st_ino,
+                "size": offset,
+                "checksum": _tail_digest(file, offset),
+                **index.to_json(),
+            }
+            write_atomic(AGGREGATES_PATH, lambda out: json.dump(aggregates, out))
+    return index
+
+
+def get_recent_day_index(num_weeks: int, timeline: LogTimeline | None = None):
+    """Day index of just the last `num_weeks` weeks, for use with get_weeks_data"""
+    timeline = get_timeline() if timeline is None else timeline
+    today = date.today()
+    week_start = today.toordinal() - today.weekday() - (num_weeks - 1) * 7
+    index = DayIndex(timeline, timeline.span(midnight(week_start), float("inf"))[0])
+    if timeline:
+        # Keep the real first day so the number of weeks available isn't understated
+        index.first_day = local_day(timeline.starts[0])
+    return index
+
+
+def get_week_data(week_start: int, index: DayIndex, is_first=False, is_last=False):
+    """Gets the daily totals of the week starting on the Monday with date ordinal `week_start`"""
     daily_totals = []
 
     add_day = not is_first
-    for i in range(time.localtime(time.time()).tm_wday + 1 if is_last else 7):
-        day_start = week_start + (i * day)
-        day_end = day_start + day
-        day_logs = [log for log in logs_list if day_start <= log["start"] < day_end]
-        total = sum(log["duration"] for log in day_logs)
+    for i in range(date.today().weekday() + 1 if is_last else 7):
+        total = index.totals.get(week_start + i, 0)
         add_day = add_day or total
         add_day and daily_totals.append(total)
 
@@ -474,52 +1981,66 @@ def get_week_data(week_start, logs_list, is_first=False, is_last=False):
         "daily_totals": daily_totals,
         "total": sum(daily_totals),
         "start": week_start,
-        "date": time.strftime("%Y-%m-%d", time.localtime(week_start)),
+        "date": date.fromordinal(week_start).isoformat(),
         "is_first": is_first,
         "is_last": is_last,
     }
 
 
-def get_weeks_data(logs=get_logs(), num_weeks=None):
+def get_weeks_data(index: DayIndex | None = None, num_weeks=None):
     """Gets week data for specified number of recent weeks, or all weeks if num_weeks is None"""
-    if not logs:
+    index = get_day_index() if index is None else index
+    if index.first_day is None:
         return []
 
-    first_log = min(logs, key=lambda x: x["start"])
-
-    now = time.time()
-    today_start = time.mktime(time.localtime(now)[:3] + (0, 0, 0, 0, 0, -1))
-    current_weekday = time.localtime(now).tm_wday
-    current_week_start = today_start - (current_weekday * day)
-
-    first_weekday = time.localtime(first_log["start"]).tm_wday
-    first_week_start = time.mktime(
-        time.localtime(first_log["start"])[:3] + (0, 0, 0, 0, 0, -1)
-    ) - (first_weekday * day)
+    today = date.today()
+    current_week_start = today.toordinal() - today.weekday()
+    first_week_start = index.first_day - date.fromordinal(index.first_day).weekday()
 
-    total_weeks = max(1, int((current_week_start - first_week_start) / week) + 1)
+    total_weeks = max(1, (current_week_start - first_week_start) // 7 + 1)
     weeks_to_fetch = min(total_weeks, num_weeks) if num_weeks else total_weeks
 
     weeks_data = []
     for i in range(weeks_to_fetch):
-        week_start = current_week_start - (i * week)
-        week_logs = [
-            log for log in logs if week_start <= log["start"] < week_start + week
-        ]
         weeks_data.append(
-            get_week_data(week_start, week_logs, i >= weeks_to_fetch - 1, i == 0)
+            get_week_data(
+                current_week_start - (i * 7), index, i >= weeks_to_fetch - 1, i == 0
+            )
         )
     weeks_data.reverse()
     return weeks_data
 
 
-def get_total_duration(logs=get_logs()):
-    return sum(log["duration"] for log in logs)
+def week_start_of(day: date) -> int:
+    """Date ordinal of the Monday starting the week of `day`"""
+    return day.toordinal() - day.weekday()
+
+
+def iter_weeks_between(timeline: LogTimeline, start: date, end: date):
+    """Yields the week data of each week with stints from the week of `start` through the
+    week of `end`, in either order"""
+    start_week, end_week = sorted([week_start_of(start), week_start_of(end)])
+    current_week_start = week_start_of(date.today())
+    index = DayIndex(
+        timeline, *timeline.span(midnight(start_week), midnight(end_week + 7))
+    )
+    for week_start in range(start_week, end_week + 1, 7):
+        if any(d in index.totals for d in range(week_start, week_start + 7)):
+            yield get_week_data(
+                week_start,
+                index,
+                is_first=week_start == start_week,
+                is_last=week_start == current_week_start,
+            )
+
 
+def get_total_duration(timeline: LogTimeline | None = None):
+    timeline = get_timeline() if timeline is None else timeline
+    return sum(timeline.durations)
 
-def show_all_week_averages(logs=get_logs()):
-    weeks_data = get_weeks_data(logs)
 
+def get_week_averages(weeks_data: list[dict]):
+    """Returns the average seconds for each weekday and the number of weeks analyzed"""
     daily_sums = [0] * 7
     daily_counts = [0] * 7
 
@@ -540,64 +2061,311 @@ def show_all_week_averages(logs=get_logs()):
         round((daily_sums[i] / daily_counts[i])) if daily_counts[i] > 0 else 0
         for i in range(7)
     ]
+    return averages, len(weeks_data)
+
+
+def show_all_week_averages(context: "AnalyticsContext | None" = None):
+    context = AnalyticsContext() if context is None else context
+    averages, num_weeks = context.week_averages
     print_rich_bar_chart(averages, labels=days, title="Daily Averages")
 
-    print(f"\nWeeks analyzed: {len(weeks_data)}")
+    print(f"\nWeeks analyzed: {num_weeks}")
 
 
-def get_running_max(lst: list[int], run_num=1, return_current_run=False):
-    max_value = 0
-    for i in range(1, len(lst) + 1):
-        max_value = max(sum(lst[max(0, i - run_num) : i]), max_value)
+def get_high_scores(intervals: list[dict], weeks_data: list[dict]):
+    """Scores every `{"unit", "amount"}` interval together in a single pass over the daily series
 
-    if return_current_run:
-        return {
-            "max_value": max_value,
-            "last_run": sum(lst[-run_num:]),
+    Each interval keeps a running window sum, so the whole pass is O(days * intervals).
+    Returns one result per interval with the current and best window sums, and the first
+    and last dates (YYYY-MM-DD) of the best window, or None if nothing has been logged.
+    """
+    results = [
+        {
+            "unit": interval["unit"],
+            "amount": interval["amount"],
+            "current": 0,
+            "high_score": 0,
+            "best_start": None,
+            "best_end": None,
         }
-    return max_value
-
+        for interval in intervals
+    ]
+    day_results = [r for r in results if r["unit"] == "day"]
+    week_results = [r for r in results if r["unit"] != "day"]
 
-def get_high_score(logs=get_logs(), unit: Literal["day", "week"] = "day", amount=1):
-    weeks_data = get_weeks_data(logs)
+    day_values, day_starts = [], []
+    week_values, week_starts = [], []
+    today = date.today()
 
-    scores = []
     for week_data in weeks_data:
-        if unit == "day":
-            scores.extend(week_data["daily_totals"])
-        else:
-            scores.append(sum(week_data["daily_totals"]))
+        daily_totals = week_data["daily_totals"]
+        num_days = today.weekday() + 1 if week_data["is_last"] else 7
+        first_day = week_data["start"] + num_days - len(daily_totals)
+
+        for i, total in enumerate(daily_totals):
+            day_values.append(total)
+            day_starts.append(first_day + i)
+            n = len(day_values)
+            for r in day_results:
+                r["current"] += total
+                if n > r["amount"]:
+                    r["current"] -= day_values[n - 1 - r["amount"]]
+                if r["current"] > r["high_score"]:
+                    r["high_score"] = r["current"]
+                    r["best_start"] = day_starts[max(0, n - r["amount"])]
+                    r["best_end"] = first_day + i
+
+        week_values.append(week_data["total"])
+        week_starts.append(week_data["start"])
+        n = len(week_values)
+        for r in week_results:
+            r["current"] += week_data["total"]
+            if n > r["amount"]:
+                r["current"] -= week_values[n - 1 - r["amount"]]
+            if r["current"] > r["high_score"]:
+                r["high_score"] = r["current"]
+                r["best_start"] = week_starts[max(0, n - r["amount"])]
+                r["best_end"] = week_data["start"] + num_days - 1
+
+    for r in results:
+        if r["best_start"] is not None:
+            r["best_start"] = date.fromordinal(r["best_start"]).isoformat()
+            r["best_end"] = date.fromordinal(r["best_end"]).isoformat()
+    return results
+
+
+def get_high_score(
+    context: "AnalyticsContext | None" = None,
+    unit: Literal["day", "week"] = "day",
+    amount=1,
+):
+    context = AnalyticsContext() if context is None else context
+    return context.high_scores([{"unit": unit, "amount": amount}])[0]
 
-    result = get_running_max(scores, amount, True)
 
-    return {
-        "current": result["last_run"],
-        "high_score": result["max_value"],
-    }
+# NumPy analytics - used in place of the pure-Python paths above when numpy is installed
+
+_np = None
+
 
+def _numpy():
+    """Returns the numpy module, or None if it isn't installed"""
+    global _np
+    if _np is None:
+        try:
+            import numpy
+
+            _np = numpy
+        except ImportError:
+            _np = False
+    return _np or None
+
+
+def get_day_totals_numpy(timeline: LogTimeline):
+    """Returns the Monday starting the first logged week, and the seconds logged on each
+    day from that Monday through today"""
+    np = _numpy()
+    if not timeline:
+        return None, np.zeros(0, dtype=np.int64)
+    today = date.today().toordinal()
+    first_day = local_day(timeline.starts[0])
+    first_day -= (first_day - 1) % 7
+    last_day = max(today, local_day(timeline.starts[-1]))
+
+    midnights = np.array(_day_table.midnights_between(first_day, last_day))
+    starts = np.frombuffer(timeline.starts, dtype=np.int64)
+    durations = np.frombuffer(timeline.durations, dtype=np.int64)
+    day_offsets = np.searchsorted(midnights, starts, side="right") - 1
+    totals = np.bincount(day_offsets, weights=durations, minlength=len(midnights))
+    return first_day, totals[: today - first_day + 1].astype(np.int64)
+
+
+def get_index_day_totals_numpy(index: DayIndex):
+    """get_day_totals_numpy from a day index, without loading the timeline"""
+    np = _numpy()
+    if index.first_day is None:
+        return None, np.zeros(0, dtype=np.int64)
+    today = date.today().toordinal()
+    first_day = index.first_day - (index.first_day - 1) % 7
+    totals = np.zeros(max(0, today - first_day + 1), dtype=np.int64)
+    for day, total in index.totals.items():
+        if day <= today:
+            totals[day - first_day] = total
+    return first_day, totals
+
+
+def _leading_empty_days(totals):
+    """Days skipped at the start of the first week, matching get_week_data's is_first"""
+    nonzero = _numpy().flatnonzero(totals[:7])
+    return int(nonzero[0]) if len(nonzero) else min(7, len(totals))
+
+
+def get_week_averages_numpy(first_day: int, totals):
+    np = _numpy()
+    if not len(totals):
+        return [0] * 7, 0
+
+    skip = _leading_empty_days(totals)
+    weekdays = np.arange(skip, len(totals)) % 7
+    sums = np.bincount(weekdays, weights=totals[skip:], minlength=7)
+    counts = np.bincount(weekdays, minlength=7)
+    averages = [round(s / c) if c else 0 for s, c in zip(sums.tolist(), counts)]
+    return averages, -(-len(totals) // 7)
+
+
+def get_high_scores_numpy(intervals: list[dict], first_day: int, totals):
+    """Vectorized get_high_scores - rolling window sums come from a single cumsum"""
+    np = _numpy()
+    results = []
+    if len(totals):
+        skip = _leading_empty_days(totals)
+        day_values = totals[skip:]
+        week_values = np.add.reduceat(totals, np.arange(0, len(totals), 7))
+        today = date.today().toordinal()
 
-def show_high_scores(logs=get_logs(), settings=get_json()):
-    intervals = json.loads(json.dumps(settings["high_score_intervals"]))
-    intervals.reverse()
     for interval in intervals:
-        result = get_high_score(logs, interval["unit"], interval["amount"])
+        result = {
+            "unit": interval["unit"],
+            "amount": interval["amount"],
+            "current": 0,
+            "high_score": 0,
+            "best_start": None,
+            "best_end": None,
+        }
+        results.append(result)
+        if not len(totals):
+            continue
+
+        values = day_values if interval["unit"] == "day" else week_values
+        if not len(values):
+            continue
+        cumsum = np.concatenate(([0], np.cumsum(values)))
+        ends = np.arange(1, len(values) + 1)
+        window_sums = cumsum[ends] - cumsum[np.maximum(0, ends - interval["amount"])]
+
+        best = int(np.argmax(window_sums))
+        result["current"] = int(window_sums[-1])
+        result["high_score"] = int(window_sums[best])
+        if not result["high_score"]:
+            continue
+
+        best_start = max(0, best + 1 - interval["amount"])
+        if interval["unit"] == "day":
+            best_start, best_end = (
+                first_day + skip + best_start,
+                first_day + skip + best,
+            )
+        else:
+            best_start, best_end = first_day + best_start * 7, min(
+                first_day + best * 7 + 6, today
+            )
+        result["best_start"] = date.fromordinal(best_start).isoformat()
+        result["best_end"] = date.fromordinal(best_end).isoformat()
+
+    return results
+
+
+class AnalyticsContext:
+    """Analytics shared by the panels of one command, each derived at most once
+
+    The day and week series are built once per context - with numpy when it's installed -
+    and every average, total and high score is computed from them on first use.
+    """
+
+    def __init__(self, timeline: LogTimeline | None = None):
+        self._timeline = timeline
+        self._high_scores: dict[tuple, dict] = {}
+
+    @cached_property
+    def timeline(self) -> LogTimeline:
+        return get_timeline() if self._timeline is None else self._timeline
+
+    @cached_property
+    def use_numpy(self):
+        return bool(_numpy())
+
+    @cached_property
+    def index(self) -> DayIndex:
+        return get_day_index() if self._timeline is None else DayIndex(self.timeline)
+
+    @cached_property
+    def weeks(self) -> list[dict]:
+        return get_weeks_data(self.index)
+
+    @cached_property
+    def day_totals(self):
+        if self._timeline is None:
+            return get_index_day_totals_numpy(self.index)
+        return get_day_totals_numpy(self.timeline)
+
+    @cached_property
+    def total_duration(self) -> int:
+        if self._timeline is None:
+            return self.index.total
+        return get_total_duration(self.timeline)
+
+    @cached_property
+    def week_averages(self) -> tuple[list[int], int]:
+        if self.use_numpy:
+            return get_week_averages_numpy(*self.day_totals)
+        return get_week_averages(self.weeks)
+
+    def recent_weeks(self, num_weeks: int) -> list[dict]:
+        if self.use_numpy and self._timeline is not None:
+            return get_weeks_data(
+                get_recent_day_index(num_weeks, self.timeline), num_weeks
+            )
+        return get_weeks_data(self.index, num_weeks)
+
+    def high_scores(self, intervals: list[dict]) -> list[dict]:
+        """Results of get_high_scores, computed together for all intervals not yet scored"""
+        keys = [(interval["unit"], interval["amount"]) for interval in intervals]
+        missing = [
+            {"unit": unit, "amount": amount}
+            for unit, amount in dict.fromkeys(keys)
+            if (unit, amount) not in self._high_scores
+        ]
+        if missing:
+            if self.use_numpy:
+                results = get_high_scores_numpy(missing, *self.day_totals)
+            else:
+                results = get_high_scores(missing, self.weeks)
+            for result in results:
+                self._high_scores[(result["unit"], result["amount"])] = result
+        return [dict(self._high_scores[key]) for key in keys]
+
+
+def show_high_scores(context: AnalyticsContext | None = None, settings=None):
+    context = AnalyticsContext() if context is None else context
+    settings = get_json() if settings is None else settings
+    results = context.high_scores(settings["high_score_intervals"])
+    results.reverse()
+    for result in results:
+        best_dates = result["best_start"] and (
+            result["best_start"]
+            if result["best_start"] == result["best_end"]
+            else f'{result["best_start"]} - {result["best_end"]}'
+        )
         print_rich_bar_chart(
-            title=f'{interval["amount"]} {interval["unit"].capitalize()} High Score',
+            title=f'{result["amount"]} {result["unit"].capitalize()} High Score'
+            + (f" ({best_dates})" if best_dates else ""),
             values=[result["high_score"], result["current"]],
             labels=["High", "Current"],
         )
 
 
-def show_summary():
-    logs = get_logs()
+def show_summary(
+    timeline: LogTimeline | None = None, context: AnalyticsContext | None = None
+):
+    context = AnalyticsContext(timeline) if context is None else context
     settings = get_json()
 
-    weeks_data = get_weeks_data(logs, 2)
+    weeks_data = context.recent_weeks(2)
 
-    show_all_week_averages(logs)
+    show_all_week_averages(context)
 
     print()
-    show_high_scores(logs, settings)
+    show_high_scores(context, settings)
 
     print()
     titles = ["This", "Last"][: len(weeks_data)]
@@ -616,15 +2384,14 @@ def show_summary():
     print()
 
 
-def show_week(logs=get_logs()):
-    if not logs:
+def show_week(timeline: LogTimeline | None = None):
+    timeline = get_timeline() if timeline is None else timeline
+    if not timeline:
         print("\nNo logs found.")
         return
 
     # Get earliest date from logs
-    earliest_date = time.strftime(
-        "%Y-%m-%d", time.localtime(min(log["start"] for log in logs))
-    )
+    earliest_date = time.strftime("%Y-%m-%d", time.localtime(timeline.starts[0]))
 
     print(f"\nEnter a date (YYYY-MM-DD) or date range (YYYY-MM-DD:YYYY-MM-DD)")
     print(f"Earliest available date: {earliest_date}")
@@ -633,39 +2400,18 @@ def show_week(logs=get_logs()):
     if not date_input:
         return
 
+    def parse_date(date_str: str):
+        return datetime.strptime(date_str, "%Y-%m-%d").date()
+
     try:
         if ":" in date_input:
             # Handle date range
             start_date, end_date = date_input.split(":")
-            start_timestamp = time.mktime(time.strptime(start_date, "%Y-%m-%d"))
-            end_timestamp = time.mktime(time.strptime(end_date, "%Y-%m-%d"))
-
-            if start_timestamp > end_timestamp:
-                start_timestamp, end_timestamp = end_timestamp, start_timestamp
-
-            # Adjust to start of weeks
-            start_weekday = time.localtime(start_timestamp).tm_wday
-            start_timestamp -= start_weekday * day
-
-            # Get all weeks in range
-            weeks_data = []
-            current_timestamp = start_timestamp
-            while current_timestamp <= end_timestamp:
-                week_logs = [
-                    log
-                    for log in logs
-                    if current_timestamp <= log["start"] < current_timestamp + week
-                ]
-                if week_logs:
-                    weeks_data.append(
-                        get_week_data(
-                            current_timestamp,
-                            week_logs,
-                            is_first=current_timestamp == start_timestamp,
-                            is_last=current_timestamp + week > end_timestamp,
-                        )
-                    )
-                current_timestamp += week
+            weeks_data = list(
+                iter_weeks_between(
+                    timeline, parse_date(start_date), parse_date(end_date)
+                )
+            )
 
             if not weeks_data:
                 print("\nNo data found for this date range.")
@@ -683,19 +2429,14 @@ def show_week(logs=get_logs()):
 
         else:
             # Handle single date
-            timestamp = time.mktime(time.strptime(date_input, "%Y-%m-%d"))
-            weekday = time.localtime(timestamp).tm_wday
-            week_start = timestamp - (weekday * day)
+            week_start = week_start_of(parse_date(date_input))
+            lo, hi = timeline.span(midnight(week_start), midnight(week_start + 7))
 
-            week_logs = [
-                log for log in logs if week_start <= log["start"] < week_start + week
-            ]
-
-            if not week_logs:
+            if lo == hi:
                 print("\nNo data found for this week.")
                 return
 
-            week_data = get_week_data(week_start, week_logs)
+            week_data = get_week_data(week_start, DayIndex(timeline, lo, hi))
             print_rich_bar_chart(
                 week_data["daily_totals"],
                 labels=days,
@@ -709,101 +2450,132 @@ def show_week(logs=get_logs()):
     print()
 
 
-def show_logs(logs=get_logs()):
-    if not logs:
+def iter_log_days(timeline: LogTimeline, positions=None, hi=None):
+    """Yields (date ordinal, index into `positions`, positions) for each day with stints,
+    newest day first, starting before `positions[hi]`
+
+    `positions` are those of the stints to show, in start order - all of them by default.
+    Each day's span is found with a bisect, so only the days consumed are visited.
+    """
+    positions = range(len(timeline)) if positions is None else positions
+    hi = len(positions) if hi is None else hi
+    while hi > 0:
+        day = local_day(timeline.starts[positions[hi - 1]])
+        lo = bisect_left(timeline.starts, midnight(day))
+        lo = bisect_left(positions, lo, 0, hi)
+        yield day, lo, positions[lo:hi]
+        hi = lo
+
+
+def show_logs(timeline: LogTimeline | None = None, page_size=20):
+    """Pages through the logs newest first, `page_size` stints (rounded up to whole days)
+    at a time"""
+    import questionary
+    from rich.console import Console
+    from rich.table import Table, box
+
+    index = get_task_index() if timeline is None else TaskIndex(timeline)
+    timeline = index.timeline
+    if not timeline:
         print("\nNo logs found.")
         return
 
     # Get unique tasks from logs
-    tasks = sorted(set(log["task"] for log in logs))
+    tasks = sorted(index.positions)
 
     # Let user select task
     selected = questionary.select(
         "Select task to view:",
         choices=[*tasks, "All tasks"],
     ).ask()
-
-    # Filter logs by selected task
-    filtered_logs = (
-        logs
-        if selected == "All tasks"
-        else [log for log in logs if log["task"] == selected]
-    )
-    if not filtered_logs:
-        print("\nNo logs found for this task.")
+    if selected is None:
         return
+    all_tasks = selected == "All tasks"
+    positions = range(len(timeline)) if all_tasks else index.positions[selected]
 
-    # Ask for number of logs to show
-    max_logs = len(filtered_logs)
-    while True:
-        try:
-            num_logs = input(
-                f"\nHow many recent logs to show? (1-{max_logs}, or press Enter for all): "
-            ).strip()
-            if not num_logs:  # Show all if empty
-                break
-            num_logs = int(num_logs)
-            if 1 <= num_logs <= max_logs:
-                filtered_logs = sorted(
-                    filtered_logs, key=lambda x: x["start"], reverse=True
-                )[:num_logs]
-
-                break
-            print(f"Please enter a number between 1 and {max_logs}")
-        except ValueError:
-            print("Please enter a valid number")
-
-    # Group logs by date
-    logs_by_date = {}
-    for log in filtered_logs:
-        date = time.strftime("%Y-%m-%d", time.localtime(log["start"]))
-        if date not in logs_by_date:
-            logs_by_date[date] = []
-        logs_by_date[date].append(log)
-
-    # Print logs grouped by date
     console = Console()
-    for date in sorted(logs_by_date.keys()):
-        weekday = time.strftime("%A", time.strptime(date, "%Y-%m-%d"))
-        table = Table(title=f"{weekday}, {date}", show_header=True, box=box.ROUNDED)
-
-        table.add_column("Time", justify="left", style="cyan")
-        table.add_column("Duration", justify="right", style="green")
-        if selected == "All tasks":
-            table.add_column("Task", style="yellow")
-        table.add_column("Notes", style="white")
-
-        daily_total = 0
-        for log in sorted(logs_by_date[date], key=lambda x: x["start"]):
-            time_str = time.strftime("%I:%M %p", time.localtime(log["start"]))
-            duration_str = seconds_to_time(log["duration"])
-            daily_total += log["duration"]
-
-            row = [
-                time_str,
-                duration_str + "\n",
-                *([log["task"]] if selected == "All tasks" else []),
-                log["notes"] + "\n" if log["notes"] else "",
-            ]
-            table.add_row(*row)
+    # Index into `positions` each visited page starts before, for paging back
+    page_starts = [len(positions)]
+    try:
+        while True:
+            days = iter_log_days(timeline, positions, page_starts[-1])
+            page, num_logs, next_start = [], 0, 0
+            for day, lo, stints in days:
+                page.append((day, stints))
+                num_logs += len(stints)
+                next_start = lo
+                if num_logs >= page_size:
+                    break
+            has_older = next(days, None) is not None
 
-        table.add_row(
-            "Total:",
-            seconds_to_time(daily_total),
-            *([""] if selected == "All tasks" else []),
-            "",
-            style="bold",
-        )
+            if not page:
+                print("\nNo logs found for this task.")
+                return
+            for day, stints in page:
+                table = Table(
+                    title=date.fromordinal(day).strftime("%A, %Y-%m-%d"),
+                    show_header=True,
+                    box=box.ROUNDED,
+                )
+                table.add_column("Time", justify="left", style="cyan")
+                table.add_column("Duration", justify="right", style="green")
+                if all_tasks:
+                    table.add_column("Task", style="yellow")
+                table.add_column("Notes", style="white")
+
+                daily_total = 0
+                for log in map(timeline.__getitem__, stints):
+                    time_str = time.strftime("%I:%M %p", time.localtime(log.start))
+                    daily_total += log.duration
+                    table.add_row(
+                        time_str,
+                        seconds_to_time(log.duration) + "\n",
+                        *([log.task] if all_tasks else []),
+                        log.notes + "\n" if log.notes else "",
+                    )
+
+                table.add_row(
+                    "Total:",
+                    seconds_to_time(daily_total),
+                    *([""] if all_tasks else []),
+                    "",
+                    style="bold",
+                )
+                print()
+                console.print(table)
 
+            while True:
+                action = input(
+                    f"\nPage {len(page_starts)} - Enter/n for older, p for newer, q to quit: "
+                )
+                action = action.strip().lower() or ("n" if has_older else "q")
+                if action == "q":
+                    return
+                if action == "n" and has_older:
+                    page_starts.append(next_start)
+                    break
+                if action == "p" and len(page_starts) > 1:
+                    page_starts.pop()
+                    break
+                print(
+                    "No more pages that way"
+                    if action in ("n", "p")
+                    else "Unknown option"
+                )
+    except KeyboardInterrupt:
         print()
-        console.print(table)
 
 
-def show_treats(logs=get_logs(), settings=get_json()):
+def show_treats(timeline: LogTimeline | None = None, settings=None):
+    from rich.console import Console
+    from rich.table import Table
+
+    context = AnalyticsContext(timeline)
+    settings = get_json() if settings is None else settings
     console = Console()
     print("\nTreat Summary\n")
 
-    total_duration = get_total_duration(logs)
+    total_duration = context.total_duration
 
     # Show total time treats
     if settings.get("total_time_treats"):
@@ -833,11 +2605,8 @@ def show_treats(logs=get_logs(), settings=get_json()):
         print()
 
     # Show high score treats
-    for interval in settings.get("high_score_intervals", []):
-        if not interval.get("treats"):
-            continue
-
-        scores = get_high_score(logs, interval["unit"], interval["amount"])
+    intervals = [i for i in settings.get("high_score_intervals", []) if i.get("treats")]
+    for interval, scores in zip(intervals, context.high_scores(intervals)):
 
         title = f"{interval['amount']} {interval['unit'].capitalize()}"
         if interval["amount"] > 1:
@@ -865,24 +2634,24 @@ def show_treats(logs=get_logs(), settings=get_json()):
         print()
 
 
+def expire_treats() -> TreatBank:
+    """Removes the expired treats from the bank, notifying the user of each"""
+    with data_lock():
+        treat_bank = get_treat_bank()
+        expired_treats = treat_bank.purge_expired(time.time())
+        if expired_treats:
+            save_treat_bank(treat_bank)
+    for treat in expired_treats:
+        print(f"Treat '{treat['description']}' has expired and has been removed.")
+    return treat_bank
+
+
 def show_treat_bank():
-    console = Console()
-    treat_bank = get_json(TREAT_BANK_PATH, [])
-
-    # Filter out expired treats and notify the user
-    current_time = time.time()
-    expired_treats = [
-        treat
-        for treat in treat_bank
-        if treat["expires_at"] and current_time > treat["expires_at"]
-    ]
-    if expired_treats:
-        for treat in expired_treats:
-            print(f"Treat '{treat['description']}' has expired and has been removed.")
-        treat_bank = [treat for treat in treat_bank if treat not in expired_treats]
-        save_json(treat_bank, TREAT_BANK_PATH)
+    from rich.console import Console
+    from rich.table import Table
 
-    treat_bank.sort(key=lambda x: x["expires_at"])
+    console = Console()
+    treat_bank = expire_treats()
 
     if not treat_bank:
         print("No treats available to redeem\n")
@@ -896,7 +2665,8 @@ def show_treat_bank():
     table.add_column("Description", ratio=1)
     table.add_column("Expires At", no_wrap=True)
 
-    for i, treat in enumerate(treat_bank):
+    treats = treat_bank.to_list()
+    for i, treat in enumerate(treats):
         expiry_str = "Never"
         if treat["expires_at"]:
             expiry_time = time.localtime(treat["expires_at"])
@@ -914,14 +2684,21 @@ def show_treat_bank():
 
             try:
                 idx = int(treat_num) - 1
-                if 0 <= idx < len(treat_bank):
-                    treat = treat_bank[idx]
+                if 0 <= idx < len(treats):
+                    treat = treats[idx]
                     # Check if the treat has expired
-                    if treat["expires_at"] and current_time > treat["expires_at"]:
+                    if treat["expires_at"] and time.time() > treat["expires_at"]:
                         print("This treat has expired and cannot be redeemed.")
                         continue
-                    treat_bank.pop(idx)
-                    save_json(treat_bank, TREAT_BANK_PATH)
+                    # Redeem from the bank as saved now, which another instance may have changed
+                    with data_lock():
+                        treat_bank = get_treat_bank()
+                        try:
+                            treat_bank.redeem(treat["id"])
+                        except KeyError:
+                            print("This treat has already been redeemed.")
+                            break
+                        save_treat_bank(treat_bank)
                     print(f"\nRedeemed treat: {treat['description']}")
                     break
                 else:
@@ -934,51 +2711,567 @@ def show_treat_bank():
         return
 
 
+def query_summary(context: AnalyticsContext, settings: dict, start=None, end=None):
+    averages, num_weeks = context.week_averages
+    return {
+        "total": context.total_duration,
+        "week_averages": dict(zip(days, averages)),
+        "weeks_analyzed": num_weeks,
+        "high_scores": context.high_scores(settings["high_score_intervals"]),
+        "recent_weeks": context.recent_weeks(2),
+    }
+
+
+def query_week(context: AnalyticsContext, settings: dict, start=None, end=None):
+    """Week data for every week with stints between the `start` and `end` dates"""
+    timeline = context.timeline
+    if not timeline:
+        return
+    yield from iter_weeks_between(
+        timeline,
+        start or date.fromtimestamp(timeline.starts[0]),
+        end or date.today(),
+    )
+
+
+def query_logs(context: AnalyticsContext, settings: dict, start=None, end=None):
+    """Stints started between the `start` and `end` dates, oldest first"""
+    timeline = context.timeline
+    lo, hi = timeline.span(
+        midnight(start.toordinal()) if start else float("-inf"),
+        midnight(end.toordinal() + 1) if end else float("inf"),
+    )
+    for i in range(lo, hi):
+        yield timeline[i].to_dict()
+
+
+def query_treats(context: AnalyticsContext, settings: dict, start=None, end=None):
+    def progress(treats: list[dict], seconds: int):
+        return [
+            {
+                "hours": treat["hours"],
+                "description": treat["treat"]["description"],
+                "progress": min(1, seconds / (treat["hours"] * 3600)),
+            }
+            for treat in sorted(treats, key=lambda x: x["hours"])
+        ]
+
+    intervals = [i for i in settings.get("high_score_intervals", []) if i.get("treats")]
+    return {
+        "total_time": {
+            "current": context.total_duration,
+            "treats": progress(
+                settings.get("total_time_treats", []), context.total_duration
+            ),
+        },
+        "intervals": [
+            {
+                "unit": interval["unit"],
+                "amount": interval["amount"],
+                "current": scores["current"],
+                "treats": progress(interval["treats"], scores["current"]),
+            }
+            for interval, scores in zip(intervals, context.high_scores(intervals))
+        ],
+        "bank": [
+            treat
+            for treat in get_treat_bank().to_list()
+            if not treat["expires_at"] or treat["expires_at"] > time.time()
+        ],
+    }
+
+
+queries = {
+    "summary": query_summary,
+    "week": query_week,
+    "logs": query_logs,
+    "treats": query_treats,
+}
+
+
+def run_query(name: str, ndjson=False, start=None, end=None, project=None, out=None):
+    """Writes the result of a query as JSON, or NDJSON with one record per line
+
+    Nothing interactive is imported or rendered, so this is cheap to poll from scripts.
+    Queries that produce many records are written as they're generated.
+    """
+    out = sys.stdout if out is None else out
+    timeline = None if project is None else get_project_timeline(project)
+    result = queries[name](AnalyticsContext(timeline), get_json(), start, end)
+    if isinstance(result, dict):
+        out.write(json.dumps(result) + "\n")
+    elif ndjson:
+        for record in result:
+            out.write(json.dumps(record) + "\n")
+    else:
+        out.write("[")
+        for i, record in enumerate(result):
+            out.write(("," if i else "") + "\n" + json.dumps(record))
+        out.write("\n]\n")
+    out.flush()
+
+
+# Profiling - spans are only installed by enable_profiling, so they cost nothing otherwise
+
+
+class Profiler:
+    """Timing spans and counters collected while a command runs with --profile"""
+
+    def __init__(self):
+        # name -> [calls, total seconds, seconds outside nested spans]
+        self.spans: dict[str, list] = {}
+        self.counters: dict[str, int] = {}
+        self.samples: dict[str, list[float]] = {}
+        self.events: list[dict] = []
+        self._children: list[float] = []
+
+    def span(self, name: str, func, counter=None):
+        """Wraps `func` so each call is timed as `name`
+
+        `counter` is a (counter name, count(args, result)) pair added to after each call.
+        """
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            self._children.append(0.0)
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                children = self._children.pop()
+                if self._children:
+                    self._children[-1] += elapsed
+                stats = self.spans.setdefault(name, [0, 0.0, 0.0])
+                stats[0] += 1
+                stats[1] += elapsed
+                stats[2] += elapsed - children
+                self.events.append(
+                    {
+                        "name": name,
+                        "ph": "X",
+                        "ts": (start - _started_at) * 1e6,
+                        "dur": elapsed * 1e6,
+                        "pid": os.getpid(),
+                        "tid": 0,
+                    }
+                )
+            if counter:
+                name_, count = counter
+                self.counters[name_] = self.counters.get(name_, 0) + count(args, result)
+            return result
+
+        return wrapper
+
+    def record(self, name: str, seconds: float):
+        self.samples.setdefault(name, []).append(seconds)
+
+    def report(self, title: str, trace_path: str | None = None):
+        """Prints the breakdown to stderr, writes the trace file and starts afresh"""
+        out = sys.stderr
+        out.write(f"\nProfile: {title}\n\n")
+        out.write(f"  {'Phase':<28}{'Calls':>8}{'Total ms':>12}{'Self ms':>12}\n")
+        spans = sorted(self.spans.items(), key=lambda x: x[1][1], reverse=True)
+        for name, (calls, total, self_time) in spans:
+            out.write(
+                f"  {name:<28}{calls:>8}{total * 1000:>12.1f}{self_time * 1000:>12.1f}\n"
+            )
+        if self.counters:
+            out.write("\n")
+        for name, count in self.counters.items():
+            out.write(f"  {name:<28}{count:>8}\n")
+        if self.samples:
+            out.write(f"\n  {'Sample':<28}{'Count':>8}{'Mean ms':>12}{'Max ms':>12}\n")
+        for name, samples in self.samples.items():
+            mean, worst = sum(samples) / len(samples), max(samples)
+            out.write(
+                f"  {name:<28}{len(samples):>8}{mean * 1000:>12.1f}{worst * 1000:>12.1f}\n"
+            )
+        out.write("\n")
+
+        if trace_path:
+            # Chrome trace event format - open in chrome://tracing or ui.perfetto.dev
+            with open(trace_path, "w") as file:
+                json.dump({"traceEvents": self.events}, file)
+        self.__init__()
+
+
+def enable_profiling() -> Profiler:
+    """Wraps the hot functions of the module in timing spans and counters"""
+    profiler = Profiler()
+    module = sys.modules[__name__]
+    targets = [
+        ("read json", module, "get_json", None),
+        ("import numpy", module, "_numpy", None),
+        (
+            "load logs",
+            LogTimeline,
+            "__init__",
+            ("stints loaded", lambda args, _: len(args[0])),
+        ),
+        (
+            "day index",
+            DayIndex,
+            "__init__",
+            ("days indexed", lambda args, _: len(args[0].totals)),
+        ),
+        (
+            "day index",
+            DayIndex,
+            "from_totals",
+            ("days indexed", lambda _, index: len(index.totals)),
+        ),
+        ("day totals", module, "get_day_totals_numpy", None),
+        ("week bucketing", module, "get_week_data", ("weeks built", lambda *_: 1)),
+        ("week averages", module, "get_week_averages", None),
+        ("week averages", module, "get_week_averages_numpy", None),
+        (
+            "high scores",
+            module,
+            "get_high_scores",
+            ("high score intervals", lambda args, _: len(args[0])),
+        ),
+        (
+            "high scores",
+            module,
+            "get_high_scores_numpy",
+            ("high score intervals", lambda args, _: len(args[0])),
+        ),
+        ("update treats", module, "update_treats", None),
+    ]
+    # Rendering is only timed when rich is installed, so `query --profile` runs without it
+    try:
+        from rich.console import Console
+    except ImportError:
+        pass
+    else:
+        targets.append(("rich render", Console, "print", None))
+    _audio.on_latency = lambda seconds: profiler.record("audio cue latency", seconds)
+    for name, owner, attribute, counter in targets:
+        func = getattr(owner, attribute)
+        setattr(owner, attribute, profiler.span(name, func, counter))
+    return profiler
+
+
+def bench_startup():
+    """Prints how long each phase of startup takes, then what commands pay on first use"""
+
+    def timed(func):
+        start = time.perf_counter()
+        try:
+            func()
+        except ImportError:
+            return None
+        return time.perf_counter() - start
+
+    def compile_source():
+        with open(os.path.abspath(__file__), "r") as file:
+            compile(file.read(), __file__, "exec")
+
+    def import_module(name):
+        return lambda: __import__(name)
+
+    ready_at = time.perf_counter()
+    # Scripts are compiled on every launch, `python -m main` uses the cached bytecode
+    compile_time = timed(compile_source) if __spec__ is None else 0
+    phases = [
+        ("Compile main.py", compile_time),
+        ("Imports and definitions", _loaded_at - _started_at),
+        ("Argument parsing", ready_at - _loaded_at),
+    ]
+    on_first_use = [
+        ("Load settings", timed(get_json)),
+        ("Load logs", timed(get_timeline)),
+        ("Build day index", timed(get_day_index)),
+        ("Import asyncio", timed(import_module("asyncio"))),
+        ("Import prompt_toolkit", timed(import_module("prompt_toolkit"))),
+        ("Import rich", timed(import_module("rich.table"))),
+        ("Import questionary", timed(import_module("questionary"))),
+        ("Import playsound", timed(import_module("playsound"))),
+        ("Import numpy", timed(import_module("numpy"))),
+    ]
+
+    def print_phases(title, rows):
+        print(f"\n{title}\n")
+        for name, seconds in rows:
+            duration = (
+                "not installed" if seconds is None else f"{seconds * 1000:.1f} ms"
+            )
+            print(f"  {name:<58}{duration:>14}")
+
+    print_phases("Startup", phases)
+    total = sum(seconds for _, seconds in phases)
+    label = "Time to first prompt, after interpreter startup"
+    print(f"\n  {label:<58}{total * 1000:>11.1f} ms")
+    print_phases("On first use", on_first_use)
+    print()
+
+
+# Interactive shell - commands run between prompts, background jobs while one is open
+
+
+class Shell:
+    """Reads commands with prompt_toolkit while background jobs run in a worker thread
+
+    Commands are looked up by code in `commands` and run one at a time by `dispatch` on
+    the main thread, between prompts, so questionary and Ctrl+C work in them as before.
+    Jobs only run while the prompt is open, and a command only starts once the job in
+    flight has finished, so the two never touch the caches at the same time.
+
+    The first prompt is a plain `input()` so launching stays fast - meanwhile a thread
+    runs each job once and imports asyncio and prompt_toolkit, ready for the next one.
+    """
+
+    def __init__(self, commands: dict[str, dict], dispatch):
+        self.commands = commands
+        self.dispatch = dispatch
+        # name -> (func, seconds between runs while the prompt stays open, or None)
+        self.jobs: dict[str, tuple] = {}
+        self._loop = None
+        self._session = None
+        self._job = None
+        self._preloader = None
+
+    def add_job(self, name: str, func, interval: float | None = None):
+        """Runs `func` in the background each time the prompt opens, then every
+        `interval` seconds for as long as it stays open"""
+        self.jobs[name] = (func, interval)
+
+    def run(self, cmd: str):
+        """Runs `cmd`, then each command entered, until ^C"""
+        while True:
+            if cmd in self.commands:
+                self.dispatch(cmd)
+            cmd = self.read()
+
+    def read(self) -> str:
+        if not (self.jobs and sys.stdin.isatty() and sys.stdout.isatty()):
+            return input()
+        if self._preloader is None:
+            import threading
+
+            self._preloader = threading.Thread(target=self._preload, daemon=True)
+            self._preloader.start()
+            cmd = input()
+            # The command may use the caches the jobs are loading
+            self._preloader.join()
+            return cmd
+        if self._loop is None:
+            import asyncio
+            from prompt_toolkit import PromptSession
+
+            self._loop = asyncio.new_event_loop()
+            self._session = PromptSession()
+        return self._loop.run_until_complete(self._read())
+
+    async def _read(self) -> str:
+        import asyncio
+        from prompt_toolkit.patch_stdout import patch_stdout
+
+        jobs = asyncio.create_task(self._run_jobs())
+        try:
+            # Anything the jobs print is shown above the prompt instead of through it
+            with patch_stdout():
+                return await self._session.prompt_async()
+        finally:
+            jobs.cancel()
+            # A thread can't be interrupted, so the job in flight is left to finish
+            await asyncio.gather(
+                jobs, *filter(None, [self._job]), return_exceptions=True
+            )
+            self._job = None
+
+    async def _run_jobs(self):
+        import asyncio
+
+        due = dict.fromkeys(self.jobs, 0.0)
+        while True:
+            now = time.monotonic()
+            name = next((name for name, at in due.items() if at <= now), None)
+            if name is None:
+                next_at = min(due.values(), default=float("inf"))
+                if next_at == float("inf"):
+                    return
+                await asyncio.sleep(next_at - now)
+                continue
+
+            func, interval = self.jobs[name]
+            due[name] = float("inf") if interval is None else now + interval
+            self._job = asyncio.ensure_future(asyncio.to_thread(self._run_job, func))
+            await asyncio.shield(self._job)
+            self._job = None
+
+    def _preload(self):
+        from importlib import import_module
+
+        for func, _ in self.jobs.values():
+            self._run_job(func)
+        import_module("asyncio")
+        import_module("prompt_toolkit.patch_stdout")
+
+    @staticmethod
+    def _run_job(func):
+        # A failing job is dropped - the command that needs its result will raise it
+        try:
+            func()
+        except Exception:
+            pass
+
+
 def main():
     def show_help():
         print(f"\n{TITLE} - Available commands:\n")
-        for c in commands:
-            print(f"{c['code']}{(6 - len(c['code'])) * ' '}{c['help']}")
+        for code, c in commands.items():
+            print(f"{code}{(6 - len(code)) * ' '}{c['help']}")
+        if project:
+            print(f"\nStats are for project: {project}")
         print()
 
-    commands = [
-        {"code": "l", "help": "Show summary", "func": show_summary, "type": "stats"},
-        {"code": "lw", "help": "Show week", "func": show_week, "type": "stats"},
-        {"code": "lt", "help": "Show treats", "func": show_treats, "type": "stats"},
-        {"code": "ll", "help": "Show logs", "func": show_logs, "type": "stats"},
-        {"code": "t", "help": "Treat bank", "func": show_treat_bank, "type": "other"},
-        {"code": "s", "help": "Start stint", "func": start_stint, "type": "other"},
-        {"code": "c", "help": "Clear console", "func": clear_console, "type": "other"},
-        {"code": "h", "help": "Help", "func": show_help, "type": "other"},
-    ]
+    def choose_project():
+        import questionary
+
+        nonlocal project
+        totals = get_task_index().totals
+        selected = questionary.select(
+            "Show stats for:",
+            choices=[
+                "All projects",
+                *(
+                    questionary.Choice(f"{task} ({seconds_to_time(total)})", task)
+                    for task, total in sorted(totals.items())
+                ),
+            ],
+        ).ask()
+        if selected is not None:
+            project = None if selected == "All projects" else selected
+
+    def warm_caches():
+        """Loads the day index the summary and treats need, so the next one doesn't wait
+        for it - kept to that so a command typed meanwhile isn't held up"""
+        get_day_index()
+
+    commands = {
+        "l": {"help": "Show summary", "func": show_summary, "type": "stats"},
+        "lw": {"help": "Show week", "func": show_week, "type": "stats"},
+        "lt": {"help": "Show treats", "func": show_treats, "type": "stats"},
+        "ll": {"help": "Show logs", "func": show_logs, "type": "stats"},
+        "p": {"help": "Choose project", "func": choose_project, "type": "other"},
+        "t": {"help": "Treat bank", "func": show_treat_bank, "type": "other"},
+        "s": {"help": "Start stint", "func": start_stint, "type": "other"},
+        "cl": {"help": "Compact logs", "func": compact_logs, "type": "other"},
+        "c": {"help": "Clear console", "func": clear_console, "type": "other"},
+        "h": {"help": "Help", "func": show_help, "type": "other"},
+    }
     parser = argparse.ArgumentParser(description=TITLE, add_help=False)
-    for command in commands:
-        parser.add_argument(
-            f"-{command['code']}", action="store_true", help=command["help"]
-        )
+    for code, command in commands.items():
+        parser.add_argument(f"-{code}", action="store_true", help=command["help"])
+    parser.add_argument(
+        "--bench-startup",
+        action="store_true",
+        help="Report how long each phase of startup takes",
+    )
+    subparsers = parser.add_subparsers(dest="subcommand")
+    query = subparsers.add_parser(
+        "query", help="Print stats as JSON without prompts, for scripts and dashboards"
+    )
+    query.add_argument("name", choices=queries)
+    query.add_argument("--ndjson", action="store_true", help="One JSON record per line")
+    query.add_argument(
+        "--json", action="store_false", dest="ndjson", help="A single JSON document"
+    )
+    query.add_argument(
+        "--from",
+        type=date.fromisoformat,
+        dest="start",
+        help="First date for week and logs, YYYY-MM-DD",
+    )
+    query.add_argument(
+        "--to",
+        type=date.fromisoformat,
+        dest="end",
+        help="Last date for week and logs, YYYY-MM-DD",
+    )
+    import_parser = subparsers.add_parser(
+        "import", help="Import stints from a CSV, NDJSON or iCalendar export"
+    )
+    import_parser.add_argument("path")
+    import_parser.add_argument(
+        "--format", choices=importers, help="Defaults to the file's extension"
+    )
+    import_parser.add_argument(
+        "--batch-size", type=int, default=10_000, help="Stints appended per write"
+    )
+    parser.add_argument("--project", help="Only include the stints of this project")
+    # Suppressed so it doesn't override a --project given before `query`
+    query.add_argument("--project", default=argparse.SUPPRESS, help="Same as above")
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print where each command spends its time (or set STINT_PROFILE=1)",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="PATH",
+        help="Also write a Chrome trace of each command to PATH (or set STINT_TRACE)",
+    )
     args = parser.parse_args()
+    project = args.project
 
-    cmd = "h"
-    for command in commands:
-        if getattr(args, command["code"]):
-            cmd = command["code"]
-            break
+    trace_path = args.trace or os.environ.get("STINT_TRACE")
+    profiler = None
+    if args.profile or trace_path or os.environ.get("STINT_PROFILE", "0") != "0":
+        profiler = enable_profiling()
+
+    def run(title: str, func, *func_args):
+        if profiler is None:
+            return func(*func_args)
+        try:
+            profiler.span(f"command {title}", func)(*func_args)
+        finally:
+            profiler.report(title, trace_path)
+
+    if args.subcommand == "query":
+        run(
+            f"query {args.name}",
+            run_query,
+            args.name,
+            args.ndjson,
+            args.start,
+            args.end,
+            args.project,
+        )
+        return
+
+    if args.subcommand == "import":
+        run("import", import_logs, args.path, args.format, args.batch_size)
+        return
+
+    if args.bench_startup:
+        bench_startup()
+        return
+
+    def dispatch(code: str):
+        command = commands[code]
+        if command["type"] == "stats" and project:
+            run(code, command["func"], get_project_timeline(project))
+        else:
+            run(code, command["func"])
+
+    shell = Shell(commands, dispatch)
+    # Left out when profiling, so each report only covers its own command
+    if profiler is None:
+        shell.add_job("expire treats", expire_treats, interval=60)
+        shell.add_job("warm caches", warm_caches)
 
     try:
-        while True:
-            for c in commands:
-                if c["code"] == cmd:
-                    c["func"]()
-                    break
-            cmd = input()
-    except KeyboardInterrupt:
+        recover_stints()
+        shell.run(next((code for code in commands if getattr(args, code)), "h"))
+    except (KeyboardInterrupt, EOFError):
         print()
         exit()
 
 
-def to_thread(func, *args):
-    Thread(target=func, args=args, daemon=True).start()
-
+_loaded_at = time.perf_counter()
 
 if __name__ == "__main__":
     main()